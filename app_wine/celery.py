@@ -0,0 +1,16 @@
+"""
+Celery app for app_wine project.
+
+The worker is started by the ``worker`` process declared in the procfile:
+``celery -A app_wine worker --loglevel=info``.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app_wine.settings')
+
+app = Celery('app_wine')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
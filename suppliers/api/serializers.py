@@ -1,3 +1,4 @@
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 from suppliers.models import Supplier
 from wines.api.serializers import WineSerializer
@@ -10,3 +11,28 @@ class SupplierSerializer(serializers.ModelSerializer):
         model = Supplier
         fields = ['id', 'user', 'nome', 'contato', 'telefone', 'email', 'endereco', 'vinhos']
         read_only_fields = ['user']
+
+    NOME_DUPLICADO = "You already have a supplier with this name."
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # A lista de vinhos só vai na resposta com ?expand=vinhos
+        if 'vinhos' not in self.context.get('expand', ()):
+            self.fields.pop('vinhos')
+
+    def validate_nome(self, value):
+        # "user" é só leitura, então o DRF não gera o validador da unique_supplier_nome_per_user
+        fornecedores = Supplier.objects.filter(user=self.context['request'].user, nome=value)
+        if self.instance is not None:
+            fornecedores = fornecedores.exclude(pk=self.instance.pk)
+        if fornecedores.exists():
+            raise serializers.ValidationError(self.NOME_DUPLICADO)
+        return value
+
+    def save(self, **kwargs):
+        # Dois pedidos simultâneos com o mesmo nome passam pelo validate_nome: a constraint decide
+        try:
+            with transaction.atomic():
+                return super().save(**kwargs)
+        except IntegrityError:
+            raise serializers.ValidationError({'nome': [self.NOME_DUPLICADO]})
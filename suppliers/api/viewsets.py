@@ -1,16 +1,46 @@
+from django.db.models import Count, Max, Prefetch
 from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticated
 from suppliers.models import Supplier
 from suppliers.api.serializers import SupplierSerializer
+from wines.api.caching import CachedResponseMixin
+from wines.api.conditional import ConditionalGetMixin
+from wines.api.pagination import CreatedAtCursorPagination
+from wines.models import Wine
 
 
-class SupplierViewSet(viewsets.ModelViewSet):
+class SupplierViewSet(CachedResponseMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Supplier.objects.all()
     serializer_class = SupplierSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
+
+    def get_expand(self):
+        # Relações incluídas na resposta só quando pedidas: ?expand=vinhos
+        return {nome for nome in self.request.query_params.get('expand', '').split(',') if nome}
 
     def get_queryset(self):
-        return Supplier.objects.filter(user=self.request.user)
+        user = self.request.user
+        queryset = Supplier.objects.filter(user=user)
+        if 'vinhos' in self.get_expand():
+            # Uma consulta para os vinhos de todos os fornecedores da página e outra para os fornecedores desses vinhos
+            fornecedores = Prefetch('fornecedores', queryset=Supplier.objects.filter(user=user).only('id'))
+            vinhos = Wine.objects.filter(user=user).prefetch_related(fornecedores)
+            queryset = queryset.prefetch_related(Prefetch('vinhos', queryset=vinhos))
+        return queryset
+
+    def get_versao(self, queryset):
+        ultima_alteracao, partes = super().get_versao(queryset)
+        if 'vinhos' in self.get_expand():
+            # Com ?expand=vinhos a resposta também muda quando os vinhos do usuário mudam
+            vinhos = Wine.objects.filter(user=self.request.user).aggregate(Max('updated_at'), Count('pk'))
+            partes += vinhos.values()
+        return ultima_alteracao, partes
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand'] = self.get_expand()
+        return context
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-17 11:41
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+
+def merge_duplicate_suppliers(apps, schema_editor):
+    # Junta fornecedores repetidos (mesmo usuário e nome) no mais antigo antes de criar a restrição de unicidade
+    Supplier = apps.get_model('suppliers', 'Supplier')
+    Wine = apps.get_model('wines', 'Wine')
+    Through = Wine.fornecedores.through
+
+    repetidos = Supplier.objects.values('user_id', 'nome').annotate(total=Count('id')).filter(total__gt=1)
+    for repetido in repetidos:
+        ids = list(Supplier.objects.filter(user_id=repetido['user_id'], nome=repetido['nome'])
+                   .order_by('id').values_list('id', flat=True))
+        manter, remover = ids[0], ids[1:]
+        vinhos = set(Through.objects.filter(supplier_id__in=remover).values_list('wine_id', flat=True))
+        vinhos -= set(Through.objects.filter(supplier_id=manter).values_list('wine_id', flat=True))
+        Through.objects.bulk_create([Through(wine_id=wine_id, supplier_id=manter) for wine_id in vinhos])
+        Supplier.objects.filter(id__in=remover).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('suppliers', '0001_initial'),
+        ('wines', '0002_importjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_suppliers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-17 11:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('suppliers', '0002_merge_duplicate_suppliers'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='supplier',
+            constraint=models.UniqueConstraint(fields=('user', 'nome'), name='unique_supplier_nome_per_user'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:40
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('suppliers', '0003_unique_supplier_nome'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplier',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='supplier',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='supplier_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('suppliers', '0004_supplier_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplier',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -11,6 +11,17 @@ class Supplier(models.Model):
     telefone = models.CharField(max_length=20, blank=True, null=True)
     email = models.EmailField(blank=True, null=True)
     endereco = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'nome'], name='unique_supplier_nome_per_user'),
+        ]
+        indexes = [
+            # Paginação por cursor da listagem de fornecedores
+            models.Index(fields=['user', 'created_at', 'id'], name='supplier_user_created_idx'),
+        ]
 
     def __str__(self):
         return self.nome
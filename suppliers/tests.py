@@ -1,3 +1,122 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from suppliers.models import Supplier
+from users.models import CustomUser
+from wines.models import Wine
+
+FORNECEDORES = '/api/v1/suppliers/suppliers/'
+
+
+class BaseTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='sommelier', password='x')
+        self.client.force_authenticate(self.user)
+
+
+class SupplierNomeTests(BaseTestCase):
+    def test_nome_repetido_e_recusado(self):
+        self.assertEqual(self.client.post(FORNECEDORES, {'nome': 'Importadora'}).status_code, 201)
+        response = self.client.post(FORNECEDORES, {'nome': 'Importadora'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('nome', response.data)
+
+    def test_renomear_para_nome_existente(self):
+        Supplier.objects.create(user=self.user, nome='Importadora')
+        outro = Supplier.objects.create(user=self.user, nome='Distribuidora')
+        response = self.client.patch(f'{FORNECEDORES}{outro.pk}/', {'nome': 'Importadora'})
+        self.assertEqual(response.status_code, 400)
+        # Regravar o próprio nome continua valendo
+        self.assertEqual(self.client.patch(f'{FORNECEDORES}{outro.pk}/', {'nome': 'Distribuidora'}).status_code, 200)
+
+    def test_mesmo_nome_em_outro_usuario(self):
+        alheio = CustomUser.objects.create_user(username='outro', password='x')
+        Supplier.objects.create(user=alheio, nome='Importadora')
+        self.assertEqual(self.client.post(FORNECEDORES, {'nome': 'Importadora'}).status_code, 201)
+
+
+class PaginacaoTests(BaseTestCase):
+    def test_cursor_percorre_tudo_sem_repetir(self):
+        fornecedores = [Supplier.objects.create(user=self.user, nome=f'Fornecedor {i}') for i in range(5)]
+        # Empate em created_at: o id desempata
+        Supplier.objects.filter(pk__in=[f.pk for f in fornecedores[1:4]]).update(
+            created_at=fornecedores[1].created_at)
+        esperado = [str(pk) for pk in Supplier.objects.filter(user=self.user).order_by('-created_at', '-id')
+                    .values_list('pk', flat=True)]
+
+        ids, url = [], FORNECEDORES + '?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [fornecedor['id'] for fornecedor in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, esperado)
+
+
+class ExpandTests(BaseTestCase):
+    def criar(self, nome, vinhos=2):
+        fornecedor = Supplier.objects.create(user=self.user, nome=nome)
+        for i in range(vinhos):
+            vinho = Wine.objects.create(user=self.user, nome=f'{nome} {i}', vinicula='Vinícola', pais='Chile',
+                                        uva='Carmenere', safra='2020', tamanho=Wine.INTEIRA,
+                                        valor_custo=Decimal('50.00'))
+            vinho.fornecedores.add(fornecedor)
+        return fornecedor
+
+    def test_vinhos_so_com_expand(self):
+        fornecedor = self.criar('Importadora')
+        self.assertNotIn('vinhos', self.client.get(FORNECEDORES).data['results'][0])
+
+        resultado = self.client.get(FORNECEDORES, {'expand': 'vinhos'}).data['results'][0]
+        self.assertCountEqual([vinho['nome'] for vinho in resultado['vinhos']], ['Importadora 0', 'Importadora 1'])
+        self.assertEqual(resultado['vinhos'][0]['fornecedores'], [fornecedor.pk])
+
+    def test_consultas_nao_crescem_com_os_fornecedores(self):
+        def contar():
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(FORNECEDORES, {'expand': 'vinhos'}).status_code, 200)
+            return len(queries.captured_queries)
+
+        self.criar('Importadora')
+        poucos = contar()
+        for i in range(5):
+            self.criar(f'Distribuidora {i}', vinhos=3)
+        self.assertEqual(contar(), poucos)
+
+    def test_expand_muda_com_os_vinhos(self):
+        fornecedor = self.criar('Importadora', vinhos=1)
+        etag = self.client.get(FORNECEDORES, {'expand': 'vinhos'})['ETag']
+        vinho = fornecedor.vinhos.get()
+        vinho.nome = 'Renomeado'
+        with self.captureOnCommitCallbacks(execute=True):
+            vinho.save()
+        response = self.client.get(FORNECEDORES, {'expand': 'vinhos'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['vinhos'][0]['nome'], 'Renomeado')
+
+
+class GetCondicionalTests(BaseTestCase):
+    def test_etag_e_last_modified(self):
+        fornecedor = Supplier.objects.create(user=self.user, nome='Importadora')
+        etag = self.client.get(FORNECEDORES)['ETag']
+        self.assertEqual(self.client.get(FORNECEDORES + '?page_size=10', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        detalhe = self.client.get(f'{FORNECEDORES}{fornecedor.pk}/')
+        response = self.client.get(f'{FORNECEDORES}{fornecedor.pk}/?format=json',
+                                   HTTP_IF_MODIFIED_SINCE=detalhe['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_renomear_muda_o_etag(self):
+        fornecedor = Supplier.objects.create(user=self.user, nome='Importadora')
+        etag = self.client.get(FORNECEDORES)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'{FORNECEDORES}{fornecedor.pk}/', {'nome': 'Distribuidora'})
+        response = self.client.get(FORNECEDORES + '?page_size=10', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['nome'], 'Distribuidora')
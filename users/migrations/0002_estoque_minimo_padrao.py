@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='estoque_minimo_padrao',
+            field=models.PositiveIntegerField(blank=True, help_text='Estoque mínimo dos vinhos sem estoque mínimo próprio; vazio desliga os alertas desses vinhos', null=True),
+        ),
+    ]
@@ -10,6 +10,9 @@ class CustomUser(AbstractUser):
     user_permissions = models.ManyToManyField(Permission, related_name='customuser_set')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    estoque_minimo_padrao = models.PositiveIntegerField(
+        blank=True, null=True,
+        help_text="Estoque mínimo dos vinhos sem estoque mínimo próprio; vazio desliga os alertas desses vinhos")
 
     class Meta:
         permissions = [
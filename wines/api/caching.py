@@ -0,0 +1,79 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date
+from rest_framework.response import Response
+
+from wines.cache import INVENTORY, get_generation
+
+EVENTOS = ('hits', 'misses')
+
+# Cabeçalhos guardados junto com os dados (ver ConditionalGetMixin)
+CABECALHOS = ('ETag', 'Last-Modified')
+
+
+def _contador(evento):
+    return f"resposta:{evento}"
+
+
+def contar(evento):
+    chave = _contador(evento)
+    cache.add(chave, 0, timeout=None)
+    try:
+        cache.incr(chave)
+    except ValueError:
+        # Despejada entre o add e o incr: perde-se uma contagem
+        pass
+
+
+def estatisticas():
+    valores = cache.get_many([_contador(evento) for evento in EVENTOS])
+    contagens = {evento: valores.get(_contador(evento), 0) for evento in EVENTOS}
+    total = sum(contagens.values())
+    contagens['hit_rate'] = round(contagens['hits'] / total, 4) if total else None
+    return contagens
+
+
+class CachedResponseMixin:
+    """
+    Cache por usuário das respostas de ``list`` e ``retrieve``, por caminho,
+    query string e formato. A chave inclui a geração do inventário do
+    usuário, que muda a cada escrita (sinais e operações em lote), então uma
+    escrita invalida todas as respostas do usuário de uma vez, sem apagar
+    nada. Num acerto não há consulta ao banco nem serialização.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self._get_cacheado(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._get_cacheado(super().retrieve, request, *args, **kwargs)
+
+    def _get_cacheado(self, handler, request, *args, **kwargs):
+        user_id = request.user.pk
+        url = f"{request.accepted_renderer.format}:{request.get_full_path()}"
+        chave = (f"resposta:{user_id}:{get_generation(INVENTORY, user_id)}:"
+                 f"{hashlib.sha1(url.encode()).hexdigest()}")
+
+        cacheada = cache.get(chave)
+        if cacheada is not None:
+            contar('hits')
+            dados, cabecalhos = cacheada
+            last_modified = cabecalhos.get('Last-Modified')
+            response = get_conditional_response(request, etag=cabecalhos.get('ETag'),
+                                                last_modified=last_modified and parse_http_date(last_modified))
+            if response is not None:
+                for nome, valor in cabecalhos.items():
+                    response[nome] = valor
+                return response
+            return Response(dados, headers={**cabecalhos, 'X-Cache': 'HIT'})
+
+        contar('misses')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cabecalhos = {nome: response[nome] for nome in CABECALHOS if response.has_header(nome)}
+            cache.set(chave, (response.data, cabecalhos), settings.RESPONSE_CACHE_TIMEOUT)
+            response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,58 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from wines.cache import INVENTORY, get_generation
+
+
+class ConditionalGetMixin:
+    """
+    GET condicional (ETag e Last-Modified) para ``list`` e ``retrieve``. Os
+    validadores vêm de um agregado barato (último ``updated_at`` e contagem)
+    mais a geração do inventário do usuário, que também muda com alterações
+    só nas relações M2M; um If-None-Match que bate devolve 304 sem rodar a
+    consulta da listagem nem os serializers.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.get_condicional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_condicional(super().retrieve, request, *args, **kwargs)
+
+    def get_versao(self, queryset):
+        # Partes do ETag; as subclasses acrescentam o que mais entra na resposta
+        stats = queryset.aggregate(ultima_alteracao=Max('updated_at'), total=Count('pk'))
+        return stats['ultima_alteracao'], [get_generation(INVENTORY, self.request.user.pk),
+                                           stats['ultima_alteracao'], stats['total']]
+
+    def get_condicional(self, handler, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        detalhe = self.lookup_url_kwarg or self.lookup_field
+        if detalhe in kwargs:
+            try:
+                queryset = queryset.filter(**{self.lookup_field: kwargs[detalhe]})
+            except ValidationError:
+                # pk malformado: o próprio handler responde 404
+                return handler(request, *args, **kwargs)
+
+        ultima_alteracao, partes = self.get_versao(queryset)
+        partes.append(request.accepted_renderer.format)
+        etag = f'"{hashlib.sha1(":".join(map(str, partes)).encode()).hexdigest()[:20]}"'
+        # Last-Modified só no detalhe: numa listagem, uma exclusão não muda o último updated_at
+        last_modified = int(ultima_alteracao.timestamp()) if ultima_alteracao and detalhe in kwargs else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            response['ETag'] = etag
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -0,0 +1,86 @@
+from django.core.exceptions import ValidationError
+from django.db import models
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+class Row(models.Func):
+    function = 'ROW'
+    output_field = models.Field()
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Paginação por cursor (keyset) do mais novo para o mais antigo: cada página
+    continua de onde a anterior parou, sem OFFSET, e custa o mesmo que a
+    primeira. O cliente escolhe o tamanho da página com ?page_size=.
+
+    O CursorPagination do DRF posiciona o cursor só pelo primeiro campo da
+    ordenação (com OR ... IS NULL, que impede o uso do índice). Aqui a posição
+    é a tupla inteira da ordenação, comparada como ROW(created_at, id) < ROW(...),
+    que o Postgres resolve direto no índice (user, created_at, id).
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    separador = '|'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor = self.decode_cursor(request)
+        if cursor is None or cursor.position is None:
+            return super().paginate_queryset(queryset, request, view)
+
+        # Aplica a posição aqui e deixa o DRF paginar a partir dela como se fosse a primeira página
+        self._cursor = cursor
+        page = super().paginate_queryset(self._apos(queryset, cursor), request, view)
+        self.cursor = cursor
+        if cursor.reverse:
+            self.has_next, self.next_position = True, cursor.position
+        else:
+            self.has_previous, self.previous_position = True, cursor.position
+        if self.template is not None:
+            self.display_page_controls = True
+        return page
+
+    def decode_cursor(self, request):
+        cursor = getattr(self, '_cursor', None)
+        if cursor is not None:
+            # Chamado de dentro de paginate_queryset: a posição já foi aplicada
+            self._cursor = None
+            return cursor._replace(position=None)
+        return super().decode_cursor(request)
+
+    def _apos(self, queryset, cursor):
+        nomes = [campo.lstrip('-') for campo in self.ordering]
+        valores = cursor.position.split(self.separador)
+        if len(valores) != len(nomes):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            # Campos do modelo ou anotações da consulta (relevância da busca)
+            campos = [queryset.query.annotations[nome].output_field if nome in queryset.query.annotations
+                      else queryset.model._meta.get_field(nome) for nome in nomes]
+            posicao = Row(*[models.Value(campo.to_python(valor), output_field=campo)
+                            for campo, valor in zip(campos, valores)])
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+        # Mesma regra do DRF: (cursor reverso) XOR (ordenação decrescente)
+        lookup = 'lt' if cursor.reverse != self.ordering[0].startswith('-') else 'gt'
+        return queryset.alias(_cursor=Row(*nomes)).filter(**{f'_cursor__{lookup}': posicao})
+
+    def _get_position_from_instance(self, instance, ordering):
+        valores = []
+        for campo in ordering:
+            nome = campo.lstrip('-')
+            valores.append(str(instance[nome] if isinstance(instance, dict) else getattr(instance, nome)))
+        return self.separador.join(valores)
+
+
+class MovimentoCursorPagination(CreatedAtCursorPagination):
+    ordering = ('-data_movimento', '-id')
+
+
+class BuscaCursorPagination(CreatedAtCursorPagination):
+    # Resultados de ?q=: do mais relevante para o menos, com created_at e id desempatando (ver buscar_vinhos)
+    ordering = ('-relevancia', '-created_at', '-id')
@@ -1,6 +1,14 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
-from wines.models import Wine, MovimentoEstoque, MarkupRule
+from wines.models import Wine, MovimentoEstoque, MarkupRule, ImportJob, MARKUP_BOUNDS_ERROR, \
+    MARKUP_OVERLAP_ERROR
 from suppliers.models import Supplier
+from wines.stock import EstoqueInsuficiente, registrar_movimento
+
+# Depois da criação o estoque só muda por movimentos, para o histórico bater com o saldo
+ESTOQUE_SOMENTE_CRIACAO = "Stock can only be set when creating a wine; register a stock movement instead."
 
 
 class WineSerializer(serializers.ModelSerializer):
@@ -8,9 +16,16 @@ class WineSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Wine
-        fields = ['id', 'user', 'imagem', 'nome', 'vinicula', 'pais', 'uva', 'safra', 'tamanho', 'fornecedores', 'valor_custo', 'markup', 'preco_venda', 'estoque']
+        fields = ['id', 'user', 'imagem', 'nome', 'vinicula', 'pais', 'uva', 'safra', 'tamanho', 'fornecedores', 'valor_custo', 'markup', 'preco_venda', 'estoque', 'estoque_minimo']
         read_only_fields = ['user', 'preco_venda']
 
+    def get_fields(self):
+        fields = super().get_fields()
+        # estoque é o estoque inicial: numa atualização vem só de MovimentoEstoque
+        if self.instance is not None:
+            fields['estoque'].read_only = True
+        return fields
+
     def get_imagem_url(self, obj):
         request = self.context.get('request')
         if obj.imagem:
@@ -26,6 +41,37 @@ class WineSerializer(serializers.ModelSerializer):
         return value
 
 
+class WineBulkItemSerializer(serializers.ModelSerializer):
+    # Item do endpoint em lote: só o formato; vinhos e fornecedores são verificados para o lote inteiro
+    id = serializers.UUIDField(required=False)
+    fornecedores = serializers.ListField(child=serializers.UUIDField(), required=False)
+
+    class Meta:
+        model = Wine
+        fields = ['id', 'nome', 'vinicula', 'pais', 'uva', 'safra', 'tamanho', 'fornecedores', 'valor_custo', 'estoque',
+                  'estoque_minimo']
+
+    def validate(self, data):
+        if 'id' in data and 'estoque' in data:
+            raise serializers.ValidationError({'estoque': [ESTOQUE_SOMENTE_CRIACAO]})
+        return data
+
+
+class WineFilterSerializer(serializers.Serializer):
+    # Filtros da listagem e das facetas, lidos da query string (ver wines.search.filtrar_vinhos)
+    q = serializers.CharField(required=False, allow_blank=True, max_length=200)
+    pais = serializers.ListField(child=serializers.CharField(), required=False)
+    uva = serializers.ListField(child=serializers.CharField(), required=False)
+    vinicula = serializers.ListField(child=serializers.CharField(), required=False)
+    safra = serializers.ListField(child=serializers.CharField(max_length=4), required=False)
+    tamanho = serializers.ListField(child=serializers.ChoiceField(choices=Wine.TAMANHO_CHOICES), required=False)
+    preco_min = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    preco_max = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+    def validate_q(self, value):
+        return value.strip()
+
+
 class MarkupRuleSerializer(serializers.ModelSerializer):
     class Meta:
         model = MarkupRule
@@ -33,46 +79,77 @@ class MarkupRuleSerializer(serializers.ModelSerializer):
         read_only_fields = ['user']
 
     def validate(self, data):
-        user = self.context['request'].user
-        min_price = data.get('min_price')
-        max_price = data.get('max_price')
+        # Num PATCH o limite que não foi enviado vem da regra atual
+        min_price = data.get('min_price', getattr(self.instance, 'min_price', None))
+        max_price = data.get('max_price', getattr(self.instance, 'max_price', None))
+        if min_price is not None and max_price is not None and min_price >= max_price:
+            raise serializers.ValidationError(MARKUP_BOUNDS_ERROR)
+        return data
+
+    def save(self, **kwargs):
+        # A sobreposição é verificada pelo banco (ExclusionConstraint), sem corrida entre requisições
+        try:
+            with transaction.atomic():
+                return super().save(**kwargs)
+        except IntegrityError:
+            raise serializers.ValidationError(MARKUP_OVERLAP_ERROR)
 
-        overlapping_rules = MarkupRule.objects.filter(
-            user=user,
-            min_price__lt=max_price,
-            max_price__gt=min_price
-        ).exclude(pk=self.instance.pk if self.instance else None)
 
-        if overlapping_rules.exists():
-            raise serializers.ValidationError("This markup rule overlaps with an existing rule.")
+class MarkupBandSerializer(serializers.Serializer):
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'))
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'))
+    percentage = serializers.DecimalField(max_digits=5, decimal_places=2)
 
+    def validate(self, data):
+        if data['min_price'] >= data['max_price']:
+            raise serializers.ValidationError(MARKUP_BOUNDS_ERROR)
         return data
 
 
+class MarkupRuleSetSerializer(serializers.Serializer):
+    rules = MarkupBandSerializer(many=True)
+
+    def validate_rules(self, value):
+        # Mesma regra da ExclusionConstraint de MarkupRule: faixas podem se tocar no limite, mas não se sobrepor
+        faixas = sorted(value, key=lambda band: band['min_price'])
+        for anterior, atual in zip(faixas, faixas[1:]):
+            if atual['min_price'] < anterior['max_price']:
+                raise serializers.ValidationError("Markup rules must not overlap.")
+        return value
+
+
+class PricingSimulationSerializer(MarkupRuleSetSerializer):
+    bins = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
 class MovimentoEstoqueSerializer(serializers.ModelSerializer):
     class Meta:
         model = MovimentoEstoque
         fields = '__all__'
 
+    def validate_vinho(self, value):
+        if value.user_id != self.context['request'].user.pk:
+            raise serializers.ValidationError("You can only register stock movements for your own wines.")
+        return value
 
-class MarkupRuleSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = MarkupRule
-        fields = ['id', 'user', 'min_price', 'max_price', 'percentage']
-        read_only_fields = ['user']
+    def create(self, validated_data):
+        try:
+            return registrar_movimento(MovimentoEstoque(**validated_data))
+        except EstoqueInsuficiente:
+            raise serializers.ValidationError({'quantidade': ["Insufficient stock for this movement."]})
 
-    def validate(self, data):
-        user = self.context['request'].user
-        min_price = data.get('min_price')
-        max_price = data.get('max_price')
 
-        overlapping_rules = MarkupRule.objects.filter(
-            user=user,
-            min_price__lt=max_price,
-            max_price__gt=min_price
-        ).exclude(pk=self.instance.pk if self.instance else None)
+class MovimentoLoteItemSerializer(serializers.Serializer):
+    # Item do endpoint em lote: só o formato; dono do vinho e estoque são verificados para o lote inteiro
+    vinho = serializers.UUIDField()
+    tipo = serializers.ChoiceField(choices=MovimentoEstoque.MOVIMENTO_CHOICES)
+    quantidade = serializers.IntegerField(min_value=0, max_value=2147483647)
 
-        if overlapping_rules.exists():
-            raise serializers.ValidationError("This markup rule overlaps with an existing rule.")
 
-        return data
\ No newline at end of file
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = ['id', 'status', 'upsert', 'linhas_processadas', 'linhas_importadas', 'linhas_atualizadas',
+                  'linhas_ignoradas', 'linhas_com_erro', 'erros', 'mensagem', 'created_at', 'updated_at', 'finished_at']
+        read_only_fields = fields
+
@@ -1,22 +1,92 @@
-import io
-
-import pandas as pd
-from django.http import HttpResponse
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import FileResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.http import parse_etags
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.views import APIView
 
 from suppliers.models import Supplier
-from wines.models import Wine, MovimentoEstoque, MarkupRule
-from wines.api.serializers import WineSerializer, MovimentoEstoqueSerializer, MarkupRuleSerializer
-from rest_framework.permissions import IsAuthenticated
-
-
-class WineViewSet(viewsets.ModelViewSet):
+from wines.api.caching import CachedResponseMixin, estatisticas
+from wines.api.conditional import ConditionalGetMixin
+from wines.api.pagination import BuscaCursorPagination, CreatedAtCursorPagination, MovimentoCursorPagination
+from wines.api.renderers import CSVRenderer, ExportContentNegotiation, NDJSONRenderer, ParquetRenderer, XLSXRenderer
+from wines.bulk import MAX_VINHOS_LOTE, bulk_save_wines
+from wines.dashboard import resumo_inventario
+from wines.exporters import FILE_WRITERS, STREAM_WRITERS, export_cache_path, inventory_version, store_file, \
+    store_stream, wine_rows
+from wines.facets import facetas
+from wines.models import Wine, MovimentoEstoque, MarkupRule, ImportJob
+from wines.pricing import replace_markup_rules, reprice_wines, simulate_pricing
+from wines.search import buscar_vinhos, filtrar_vinhos
+from wines.api.serializers import WineSerializer, MovimentoEstoqueSerializer, MarkupRuleSerializer, ImportJobSerializer, \
+    MarkupRuleSetSerializer, MovimentoLoteItemSerializer, PricingSimulationSerializer, WineBulkItemSerializer, \
+    WineFilterSerializer
+from wines.stock import MAX_DIAS_HISTORICO, MAX_MOVIMENTOS_LOTE, alertas_estoque_baixo, registrar_movimentos, \
+    serie_estoque
+from wines.tasks import processar_importacao
+from wines.validation import dry_run
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+
+
+def _flag(request, nome):
+    # Opção booleana enviada no formulário ou na query string (?upsert=true)
+    valor = request.data.get(nome, request.query_params.get(nome, ''))
+    return str(valor).lower() in ('1', 'true', 'on', 'yes')
+
+
+def _filtros(request):
+    serializer = WineFilterSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+def _data(request, nome):
+    valor = request.query_params.get(nome)
+    if not valor:
+        return None
+    try:
+        data = parse_date(valor)
+    except ValueError:
+        data = None
+    if data is None:
+        raise ValidationError({nome: "Date must be in YYYY-MM-DD format."})
+    return data
+
+
+class WineViewSet(CachedResponseMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Wine.objects.all()
     serializer_class = WineSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
+
+    # Texto de ?q= da listagem atual (ver filter_queryset)
+    busca = None
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action != 'list':
+            return queryset
+        filtros = _filtros(self.request)
+        self.busca = filtros.get('q')
+        queryset = filtrar_vinhos(queryset, filtros)
+        return buscar_vinhos(queryset, self.busca) if self.busca else queryset
+
+    @property
+    def paginator(self):
+        # Com ?q= a listagem pagina pela relevância, no mesmo formato da listagem normal
+        if self.busca and not hasattr(self, '_paginator'):
+            self._paginator = BuscaCursorPagination()
+        return super().paginator
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -24,17 +94,122 @@ class WineViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        # Cria (itens sem "id") e atualiza parcialmente (itens com "id") vários vinhos numa transação
+        itens = request.data
+        if not isinstance(itens, list):
+            return Response({'detail': "Expected a list of wines."}, status=400)
+        if len(itens) > MAX_VINHOS_LOTE:
+            return Response({'detail': f"At most {MAX_VINHOS_LOTE} wines per request."}, status=400)
+
+        # Um serializer para as criações e outro, parcial, para as atualizações: os campos são montados uma vez só
+        atualizacoes = [i for i, item in enumerate(itens) if isinstance(item, dict) and 'id' in item]
+        criacoes = sorted(set(range(len(itens))) - set(atualizacoes))
+        validos, erros = [None] * len(itens), [{}] * len(itens)
+        for indices, partial in ((criacoes, False), (atualizacoes, True)):
+            serializer = WineBulkItemSerializer(data=[itens[i] for i in indices], many=True, partial=partial)
+            if serializer.is_valid():
+                for i, dados in zip(indices, serializer.validated_data):
+                    validos[i] = dados
+            else:
+                for i, erro in zip(indices, serializer.errors):
+                    erros[i] = erro
+        if any(erros):
+            return Response({'erros': erros}, status=400)
+
+        vinhos, erros_lote = bulk_save_wines(request.user, validos)
+        if erros_lote:
+            erros = [{'non_field_errors': [erros_lote[i]]} if i in erros_lote else {} for i in range(len(itens))]
+            return Response({'erros': erros}, status=400)
+
+        # Relê os vinhos com os fornecedores numa consulta para a resposta
+        salvos = self.get_queryset().in_bulk([vinho.pk for vinho in vinhos])
+        serializer = self.get_serializer([salvos[vinho.pk] for vinho in vinhos], many=True)
+        criados = sum(1 for item in validos if 'id' not in item)
+        return Response({'criados': criados, 'atualizados': len(validos) - criados, 'vinhos': serializer.data})
+
+    @action(detail=False, methods=['get'])
+    def facetas(self, request):
+        # Contagens por país, uva, vinícula, safra, tamanho e faixa de preço, com os mesmos filtros da listagem
+        return Response(facetas(request.user, _filtros(request)))
+
+    @action(detail=False, methods=['get'])
+    def resumo(self, request):
+        # Totais do inventário para o dashboard (em cache até a próxima escrita)
+        return Response(resumo_inventario(request.user))
+
+    @action(detail=False, methods=['get'])
+    def estoque_baixo(self, request):
+        # Vinhos no ou abaixo do estoque mínimo, agrupados por fornecedor
+        return Response(alertas_estoque_baixo(request.user))
+
+    @action(detail=True, methods=['get'])
+    def estoque_historico(self, request, pk=None):
+        # Estoque no fim de cada dia entre ?inicio= e ?fim= (AAAA-MM-DD; padrão: últimos 30 dias)
+        fim = _data(request, 'fim') or timezone.localdate()
+        inicio = _data(request, 'inicio') or fim - timedelta(days=29)
+        if (fim - inicio).days >= MAX_DIAS_HISTORICO:
+            raise ValidationError({'inicio': f"The range must have at most {MAX_DIAS_HISTORICO} days."})
+        return Response(serie_estoque(self.get_object(), inicio, fim))
+
     def get_queryset(self):
-        return Wine.objects.filter(user=self.request.user)
+        # PKs dos fornecedores de todos os vinhos da página numa única consulta
+        fornecedores = Prefetch('fornecedores', queryset=Supplier.objects.only('id'))
+        # O documento da busca só é usado no WHERE
+        return Wine.objects.filter(user=self.request.user).defer('busca').prefetch_related(fornecedores)
 
 
-class MarkupRuleViewSet(viewsets.ModelViewSet):
+class MarkupRuleViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = MarkupRule.objects.all()
     serializer_class = MarkupRuleSerializer
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+        self.vinhos_atualizados = reprice_wines(self.request.user.pk)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        self.vinhos_atualizados = reprice_wines(self.request.user.pk)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        reprice_wines(self.request.user.pk)
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.data['vinhos_atualizados'] = self.vinhos_atualizados
+        return response
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        response.data['vinhos_atualizados'] = self.vinhos_atualizados
+        return response
+
+    @action(detail=False, methods=['post'])
+    def reprice(self, request):
+        # Reaplica as regras atuais a todos os vinhos do usuário
+        return Response({'vinhos_atualizados': reprice_wines(request.user.pk)})
+
+    @action(detail=False, methods=['put'])
+    def replace(self, request):
+        # Substitui a tabela inteira de faixas do usuário de uma vez
+        serializer = MarkupRuleSetSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        regras, vinhos_atualizados = replace_markup_rules(request.user, serializer.validated_data['rules'])
+        return Response({
+            'rules': MarkupRuleSerializer(regras, many=True).data,
+            'vinhos_atualizados': vinhos_atualizados,
+        })
+
+    @action(detail=False, methods=['post'])
+    def simulate(self, request):
+        # Receita, margem e distribuição de preços com as faixas propostas, sem gravar nada
+        serializer = PricingSimulationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dados = serializer.validated_data
+        return Response(simulate_pricing(request.user.pk, dados['rules'], bins=dados['bins']))
 
     def get_queryset(self):
         return MarkupRule.objects.filter(user=self.request.user)
@@ -42,116 +217,146 @@ class MarkupRuleViewSet(viewsets.ModelViewSet):
 
 class ExportExcelView(APIView):
     permission_classes = [IsAuthenticated]
+    renderer_classes = [XLSXRenderer, CSVRenderer, NDJSONRenderer, ParquetRenderer]
+    content_negotiation_class = ExportContentNegotiation
 
     def get(self, request):
-        # Obter o usuário autenticado
-        user = request.user
-
-        # Obter os vinhos do usuário
-        vinhos = Wine.objects.filter(user=user)
-
-        # Criar DataFrame para vinhos
-        vinhos_data = [
-            {
-                'Nome': vinho.nome,
-                'Vinícola': vinho.vinicula,
-                'País': vinho.pais,
-                'Uva': vinho.uva,
-                'Safra': vinho.safra,
-                'Tamanho': vinho.get_tamanho_display(),
-                'Fornecedores': ', '.join([fornecedor.nome for fornecedor in vinho.fornecedores.all()]),
-                'Valor de Custo': vinho.valor_custo,
-                'Markup': vinho.markup,
-                'Preço de Venda': vinho.preco_venda,
-                'Estoque': vinho.estoque
-            }
-            for vinho in vinhos
-        ]
-        vinhos_df = pd.DataFrame(vinhos_data)
-
-        # Criar um arquivo Excel em memória
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            vinhos_df.to_excel(writer, sheet_name='Vinhos', index=False)
-
-        output.seek(0)
-
-        # Criar resposta HTTP com o arquivo Excel
-        response = HttpResponse(output, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename=vinhos_fornecedores.xlsx'
-
+        # Formato escolhido por ?format= (xlsx por padrão; csv, ndjson ou parquet)
+        renderer = request.accepted_renderer
+        content_type = f"{renderer.media_type}; charset={renderer.charset}" if renderer.charset else renderer.media_type
+
+        # Inventário sem alterações: 304 para quem já tem o arquivo, ou o arquivo guardado no cache
+        version = inventory_version(request.user)
+        etag = f'"{version}-{renderer.format}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return HttpResponseNotModified(headers={'ETag': etag})
+
+        caminho = export_cache_path(request.user, renderer.format, version)
+        try:
+            response = FileResponse(open(caminho, 'rb'), content_type=content_type)
+        except FileNotFoundError:
+            rows = wine_rows(request.user)
+            if renderer.format in STREAM_WRITERS:
+                # Formatos de texto são enviados enquanto as linhas são lidas do banco
+                chunks = store_stream(STREAM_WRITERS[renderer.format](rows), caminho)
+                response = StreamingHttpResponse(chunks, content_type=content_type)
+            else:
+                # xlsx e parquet só ficam válidos depois de fechados: são gravados no cache e enviados em blocos
+                store_file(FILE_WRITERS[renderer.format], rows, caminho)
+                response = FileResponse(open(caminho, 'rb'), content_type=content_type)
+
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        response['Content-Disposition'] = f'attachment; filename=vinhos_fornecedores.{renderer.format}'
         return response
 
+    def handle_exception(self, exc):
+        # Erros são sempre devolvidos em JSON, qualquer que seja o formato pedido
+        self.request.accepted_renderer = JSONRenderer()
+        self.request.accepted_media_type = JSONRenderer.media_type
+        return super().handle_exception(exc)
+
 
 class ImportExcelView(APIView):
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
 
     def post(self, request):
-        # Obter o usuário autenticado
-        user = request.user
-
         # Obter o arquivo do request
         excel_file = request.FILES.get('file')
+        if excel_file is None:
+            return Response({"error": "Nenhum arquivo enviado."}, status=400)
+
+        # dry_run: só valida a planilha inteira e devolve o relatório, sem gravar nada
+        if _flag(request, 'dry_run'):
+            try:
+                return Response(dry_run(excel_file))
+            except ValueError as exc:
+                return Response({"error": str(exc)}, status=400)
+
+        # Guardar o arquivo e enfileirar a importação no worker do Celery
+        job = ImportJob.objects.create(user=request.user, arquivo=excel_file, upsert=_flag(request, 'upsert'))
+        transaction.on_commit(lambda: processar_importacao.delay(str(job.id)))
+
+        serializer = ImportJobSerializer(job)
+        headers = {'Location': reverse('wines:importjob-detail', args=[job.id], request=request)}
+        return Response(serializer.data, status=202, headers=headers)
+
+
+class ResponseCacheStatsView(APIView):
+    # Acertos e falhas do cache de respostas da API (todos os usuários)
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(estatisticas())
+
+
+class ImportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = ImportJob.objects.all()
+    serializer_class = ImportJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    @action(detail=True, methods=['post'])
+    def retry(self, request, pk=None):
+        # Retoma uma importação que falhou a partir da primeira linha ainda não gravada
+        job = self.get_object()
+        if job.status != ImportJob.FAILED:
+            return Response({'detail': "Only failed import jobs can be retried."}, status=400)
+        if not job.arquivo:
+            return Response({'detail': "The uploaded file is no longer available; upload it again."}, status=400)
+        # Condicional: duas tentativas simultâneas não enfileiram o job duas vezes
+        if not ImportJob.objects.filter(pk=job.pk, status=ImportJob.FAILED).update(
+                status=ImportJob.QUEUED, finished_at=None, updated_at=timezone.now()):
+            return Response({'detail': "Only failed import jobs can be retried."}, status=400)
+        transaction.on_commit(lambda: processar_importacao.delay(str(job.id)))
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data, status=202)
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(user=self.request.user)
+
 
-        # Ler o arquivo Excel
-        df = pd.read_excel(excel_file)
-
-        # Substituir valores nulos por valores padrão
-        df.fillna({
-            'Nome': '',
-            'Vinícola': '',
-            'País': '',
-            'Uva': '',
-            'Safra': '',
-            'Tamanho': 'inteira',
-            'Fornecedores': '',
-            'Valor de Custo': 0.0,
-            'Markup': 0.0,
-            'Preço de Venda': 0.0,
-            'Estoque': 0
-        }, inplace=True)
-
-        # Iterar sobre as linhas do DataFrame e criar vinhos
-        for index, row in df.iterrows():
-            # Criar ou obter fornecedores
-            fornecedores_nomes = str(row['Fornecedores']).split(', ')
-            fornecedores = []
-            for nome in fornecedores_nomes:
-                fornecedor, created = Supplier.objects.get_or_create(nome=nome.strip(), user=user)
-                fornecedores.append(fornecedor)
-
-            # Tratar valores nulos e garantir que os valores estejam no formato correto
-            tamanho = str(row['Tamanho']).lower() if not pd.isna(row['Tamanho']) else 'inteira'
-            valor_custo = row['Valor de Custo'] if not pd.isna(row['Valor de Custo']) else 0.0
-            markup = row['Markup'] if not pd.isna(row['Markup']) else 0.0
-            preco_venda = row['Preço de Venda'] if not pd.isna(row['Preço de Venda']) else 0.0
-            estoque = int(row['Estoque']) if not pd.isna(row['Estoque']) else 0
-
-            # Criar o vinho
-            vinho = Wine.objects.create(
-                user=user,
-                nome=row['Nome'],
-                vinicula=row['Vinícola'],
-                pais=row['País'],
-                uva=row['Uva'],
-                safra=row['Safra'],
-                tamanho=tamanho,
-                valor_custo=valor_custo,
-                markup=markup,
-                preco_venda=preco_venda,
-                estoque=estoque
-            )
-            vinho.fornecedores.set(fornecedores)
-            vinho.save()
-
-        return Response({"message": "Vinhos importados com sucesso!"}, status=201)
-
-
-class MovimentoEstoqueViewSet(viewsets.ModelViewSet):
+class MovimentoEstoqueViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = MovimentoEstoque.objects.all()
     serializer_class = MovimentoEstoqueSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = MovimentoCursorPagination
+    # O movimento já foi aplicado ao estoque: correções são feitas com um movimento contrário
+    http_method_names = ['get', 'post', 'head', 'options']
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        # Lista de movimentos do PDV/recebimento; cada item é aceito ou recusado individualmente
+        itens = request.data
+        if not isinstance(itens, list):
+            return Response({'detail': "Expected a list of stock movements."}, status=400)
+        if len(itens) > MAX_MOVIMENTOS_LOTE:
+            return Response({'detail': f"At most {MAX_MOVIMENTOS_LOTE} movements per request."}, status=400)
+
+        resultados = [None] * len(itens)
+        serializer = MovimentoLoteItemSerializer(data=itens, many=True)
+        if serializer.is_valid():
+            validos = list(enumerate(serializer.validated_data))
+        else:
+            # Os erros vêm alinhados com os itens ({} para os válidos)
+            validos = []
+            for indice, (item, erros) in enumerate(zip(itens, serializer.errors)):
+                if erros:
+                    resultados[indice] = {'indice': indice, 'status': 'erro', 'erros': erros}
+                else:
+                    item_serializer = MovimentoLoteItemSerializer(data=item)
+                    item_serializer.is_valid()
+                    validos.append((indice, item_serializer.validated_data))
+
+        gravados = registrar_movimentos(request.user, [dados for _, dados in validos])
+        for (indice, _), resultado in zip(validos, gravados):
+            if isinstance(resultado, MovimentoEstoque):
+                resultados[indice] = {'indice': indice, 'status': 'ok', 'id': resultado.pk}
+            else:
+                resultados[indice] = {'indice': indice, 'status': 'erro', 'erros': {'non_field_errors': [resultado]}}
+
+        aceitos = sum(resultado['status'] == 'ok' for resultado in resultados)
+        return Response({'aceitos': aceitos, 'recusados': len(resultados) - aceitos, 'resultados': resultados})
 
     def get_queryset(self):
-        return MovimentoEstoque.objects.filter(vinho__user=self.request.user)
+        return MovimentoEstoque.objects.filter(user=self.request.user)
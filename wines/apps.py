@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class WinesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'wines'
+
+    def ready(self):
+        import wines.signals  # noqa: F401
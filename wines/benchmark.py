@@ -0,0 +1,97 @@
+import csv
+import random
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from openpyxl import Workbook
+
+PAISES = ['Brasil', 'Argentina', 'Chile', 'Uruguai', 'Portugal', 'Espanha', 'França', 'Itália', 'África do Sul',
+          'Estados Unidos', 'Austrália', 'Nova Zelândia']
+UVAS = ['Cabernet Sauvignon', 'Merlot', 'Malbec', 'Tannat', 'Carménère', 'Pinot Noir', 'Syrah', 'Tempranillo',
+        'Touriga Nacional', 'Sangiovese', 'Chardonnay', 'Sauvignon Blanc', 'Riesling', 'Moscato']
+COLUNAS = ['Nome', 'Vinícola', 'País', 'Uva', 'Safra', 'Tamanho', 'Fornecedores', 'Valor de Custo', 'Markup',
+           'Estoque']
+
+
+def synthetic_rows(total, seed=42):
+    """
+    Gera ``total`` linhas de planilha de importação com distribuição parecida
+    com a de um catálogo real: poucos fornecedores concentram a maior parte dos
+    vinhos e cada vinho tem de 1 a 3 fornecedores.
+    """
+    rng = random.Random(seed)
+    fornecedores = [f"Distribuidora {i:04d}" for i in range(max(5, total // 50))]
+    # Pesos de Zipf: o fornecedor i recebe vinhos na proporção 1/(i+1)
+    pesos = [1 / (i + 1) for i in range(len(fornecedores))]
+    vinicolas = [f"Vinícola {i:04d}" for i in range(max(10, total // 20))]
+
+    for i in range(total):
+        quantidade = rng.choices([1, 2, 3], weights=[6, 3, 1])[0]
+        nomes = set(rng.choices(fornecedores, weights=pesos, k=quantidade))
+        yield [
+            f"Vinho {i:06d}",
+            rng.choice(vinicolas),
+            rng.choice(PAISES),
+            rng.choice(UVAS),
+            str(rng.randint(1990, 2023)),
+            rng.choices(['inteira', 'meia'], weights=[9, 1])[0],
+            ', '.join(sorted(nomes)),
+            round(rng.lognormvariate(4, 0.8), 2) + 0.01,
+            rng.choice([30, 50, 80, 100]),
+            rng.randint(0, 120),
+        ]
+
+
+def write_workbook(path, total, seed=42):
+    if str(path).endswith('.csv'):
+        with open(path, 'w', encoding='utf-8', newline='') as arquivo:
+            writer = csv.writer(arquivo)
+            writer.writerow(COLUNAS)
+            writer.writerows(synthetic_rows(total, seed))
+        return path
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Vinhos')
+    sheet.append(COLUNAS)
+    for row in synthetic_rows(total, seed):
+        sheet.append(row)
+    workbook.save(path)
+    return path
+
+
+@contextmanager
+def measure(resultado):
+    # Tempo de relógio, pico de memória alocada pelo Python (tracemalloc) e número de consultas SQL
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            yield
+    finally:
+        resultado['tempo_s'] = round(time.perf_counter() - inicio, 4)
+        resultado['memoria_pico_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        tracemalloc.stop()
+    resultado['queries'] = len(queries.captured_queries)
+
+
+def compare(atual, baseline, tolerancia):
+    """
+    Compara duas execuções ``{tamanho: {cenario: metricas}}`` e devolve as
+    regressões: tempo ou memória acima de ``baseline * (1 + tolerancia)`` ou
+    qualquer consulta SQL a mais.
+    """
+    regressoes = []
+    for tamanho, cenarios in atual.items():
+        for cenario, metricas in cenarios.items():
+            anterior = baseline.get(tamanho, {}).get(cenario)
+            if not anterior:
+                continue
+            for metrica in ('tempo_s', 'memoria_pico_mb'):
+                if anterior[metrica] and metricas[metrica] > anterior[metrica] * (1 + tolerancia):
+                    regressoes.append((tamanho, cenario, metrica, anterior[metrica], metricas[metrica]))
+            if metricas['queries'] > anterior['queries']:
+                regressoes.append((tamanho, cenario, 'queries', anterior['queries'], metricas['queries']))
+    return regressoes
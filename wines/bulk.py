@@ -0,0 +1,78 @@
+from django.db import transaction
+from django.utils import timezone
+
+from suppliers.models import Supplier
+from wines.cache import invalidate_inventory
+from wines.models import Wine
+from wines.pricing import get_markup_index
+
+# Limite de vinhos por requisição do endpoint em lote
+MAX_VINHOS_LOTE = 1000
+
+# Sempre regravados numa atualização em lote: o preço é recalculado em memória
+CAMPOS_CALCULADOS = ['markup', 'preco_venda', 'updated_at']
+
+
+def bulk_save_wines(user, itens):
+    """
+    Cria e atualiza vinhos em lote. ``itens`` são dicts já validados com os
+    campos de ``Wine`` e, opcionalmente, ``id`` (atualização parcial de um
+    vinho existente) e ``fornecedores`` (lista de PKs, substitui a atual).
+
+    Fornecedores e vinhos existentes são buscados com um ``IN`` cada, os
+    preços são calculados em memória com o índice de markup e a gravação usa
+    ``bulk_create``/``bulk_update`` e uma única inserção na tabela M2M.
+    Retorna ``(vinhos, erros)``; com algum erro (``{indice: mensagem}``) nada
+    é gravado.
+    """
+    pks_fornecedores = {pk for item in itens for pk in item.get('fornecedores', ())}
+    pks_vinhos = [item['id'] for item in itens if 'id' in item]
+
+    with transaction.atomic():
+        fornecedores = set(Supplier.objects.filter(user=user, pk__in=pks_fornecedores).values_list('pk', flat=True))
+        existentes = Wine.objects.select_for_update().filter(user=user, pk__in=pks_vinhos).in_bulk()
+
+        erros, vistos = {}, set()
+        for indice, item in enumerate(itens):
+            if 'id' in item and item['id'] not in existentes:
+                erros[indice] = "Wine not found."
+            elif 'id' in item and item['id'] in vistos:
+                erros[indice] = "The same wine appears more than once."
+            elif not fornecedores.issuperset(item.get('fornecedores', ())):
+                erros[indice] = "You can only associate wines with your own suppliers."
+            vistos.add(item.get('id'))
+        if erros:
+            return [], erros
+
+        index = get_markup_index(user.pk)
+        agora = timezone.now()
+        vinhos, novos, alterados, campos, links = [], [], [], set(), {}
+        for item in itens:
+            dados = {campo: valor for campo, valor in item.items() if campo not in ('id', 'fornecedores')}
+            if 'id' in item:
+                vinho = existentes[item['id']]
+                for campo, valor in dados.items():
+                    setattr(vinho, campo, valor)
+                vinho.updated_at = agora
+                campos.update(dados)
+                alterados.append(vinho)
+            else:
+                vinho = Wine(user=user, **dados)
+                novos.append(vinho)
+            vinho.calcular_preco_venda(index.lookup(vinho.valor_custo))
+            if 'fornecedores' in item:
+                links[vinho.pk] = dict.fromkeys(item['fornecedores'])
+            vinhos.append(vinho)
+
+        Through = Wine.fornecedores.through
+        Wine.objects.bulk_create(novos)
+        if alterados:
+            Wine.objects.bulk_update(alterados, sorted(campos) + CAMPOS_CALCULADOS)
+            Through.objects.filter(wine_id__in=[vinho.pk for vinho in alterados if vinho.pk in links]).delete()
+        Through.objects.bulk_create([
+            Through(wine_id=vinho_id, supplier_id=fornecedor_id)
+            for vinho_id, pks in links.items() for fornecedor_id in pks
+        ])
+        # bulk_create/bulk_update não disparam sinais
+        invalidate_inventory(user.pk)
+    return vinhos, {}
@@ -0,0 +1,37 @@
+import time
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Geração do inventário de cada usuário: muda a cada escrita em Wine, Supplier, MarkupRule ou MovimentoEstoque
+INVENTORY = 'inventario'
+
+
+def _generation_key(namespace, user_id):
+    return f"generation:{namespace}:{user_id}"
+
+
+def get_generation(namespace, user_id):
+    key = _generation_key(namespace, user_id)
+    value = cache.get(key)
+    if value is None:
+        # Começa pelo relógio em ms: se a chave for despejada do cache, a nova geração nunca repete uma antiga
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def bump_generation(namespace, user_id):
+    key = _generation_key(namespace, user_id)
+    cache.add(key, int(time.time() * 1000), timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # A chave foi despejada entre o add e o incr
+        return get_generation(namespace, user_id)
+
+
+def invalidate_inventory(user_id):
+    # Só depois do commit, para que ninguém gere um cache novo a partir de dados ainda não gravados
+    transaction.on_commit(partial(bump_generation, INVENTORY, user_id))
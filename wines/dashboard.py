@@ -0,0 +1,57 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from suppliers.models import Supplier
+from wines.cache import INVENTORY, get_generation
+from wines.models import Wine
+
+TOP_FORNECEDORES = 5
+
+# A chave muda junto com a geração do inventário: o timeout só limpa entradas abandonadas
+RESUMO_TIMEOUT = 60 * 60 * 24
+
+
+def _valor(preco, estoque='estoque'):
+    return Coalesce(
+        Sum(ExpressionWrapper(F(preco) * F(estoque), output_field=DecimalField(max_digits=20, decimal_places=2))),
+        Decimal('0'),
+    )
+
+
+def resumo_inventario(user):
+    """
+    Totais do inventário do usuário para o dashboard: garrafas em estoque,
+    valor do estoque a custo e a preço de venda, markup médio e os
+    fornecedores com maior valor em estoque (a custo). Calculado no banco e
+    guardado no cache até a próxima escrita no inventário.
+    """
+    chave = f"resumo_inventario:{user.pk}:{get_generation(INVENTORY, user.pk)}"
+    resumo = cache.get(chave)
+    if resumo is not None:
+        return resumo
+
+    resumo = Wine.objects.filter(user=user).aggregate(
+        total_vinhos=Count('id'),
+        total_garrafas=Coalesce(Sum('estoque'), 0),
+        valor_custo=_valor('valor_custo'),
+        valor_venda=_valor('preco_venda'),
+        markup_medio=Avg('markup'),
+    )
+    # Um vinho com vários fornecedores conta inteiro em cada um deles
+    fornecedores = (
+        Supplier.objects.filter(user=user)
+        .annotate(
+            garrafas=Sum('vinhos__estoque', filter=Q(vinhos__estoque__gt=0)),
+            valor_custo=_valor('vinhos__valor_custo', 'vinhos__estoque'),
+        )
+        .filter(garrafas__gt=0)
+        .order_by('-valor_custo', 'nome')
+        .values('id', 'nome', 'garrafas', 'valor_custo')[:TOP_FORNECEDORES]
+    )
+    resumo['markup_medio'] = round(resumo['markup_medio'], 2) if resumo['markup_medio'] is not None else None
+    resumo['top_fornecedores'] = list(fornecedores)
+    cache.set(chave, resumo, RESUMO_TIMEOUT)
+    return resumo
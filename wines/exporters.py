@@ -0,0 +1,178 @@
+import csv
+import glob
+import hashlib
+import os
+import uuid
+from itertools import islice
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Case, Count, F, Max, Value, When
+from openpyxl import Workbook
+
+from wines.cache import INVENTORY, get_generation
+from wines.models import Wine
+
+# (campo, título da coluna): os títulos são os mesmos aceitos pela importação
+EXPORT_FIELDS = [
+    ('nome', 'Nome'),
+    ('vinicula', 'Vinícola'),
+    ('pais', 'País'),
+    ('uva', 'Uva'),
+    ('safra', 'Safra'),
+    ('tamanho', 'Tamanho'),
+    ('fornecedores', 'Fornecedores'),
+    ('valor_custo', 'Valor de Custo'),
+    ('markup', 'Markup'),
+    ('preco_venda', 'Preço de Venda'),
+    ('estoque', 'Estoque'),
+]
+EXPORT_COLUMNS = [titulo for _, titulo in EXPORT_FIELDS]
+
+PARQUET_SCHEMA = pa.schema([
+    ('nome', pa.string()),
+    ('vinicula', pa.string()),
+    ('pais', pa.string()),
+    ('uva', pa.string()),
+    ('safra', pa.string()),
+    ('tamanho', pa.string()),
+    ('fornecedores', pa.string()),
+    ('valor_custo', pa.decimal128(10, 2)),
+    ('markup', pa.decimal128(5, 2)),
+    ('preco_venda', pa.decimal128(10, 2)),
+    ('estoque', pa.int64()),
+])
+
+# Linhas lidas do banco por vez e linhas agrupadas em cada bloco enviado ao cliente
+CHUNK_SIZE = 2000
+
+
+def wine_rows(user):
+    # Uma única consulta: nomes dos fornecedores agregados com string_agg e tamanho traduzido no próprio SQL
+    tamanho_display = Case(
+        *[When(tamanho=valor, then=Value(titulo)) for valor, titulo in Wine.TAMANHO_CHOICES],
+        default=F('tamanho'),
+    )
+    wines = Wine.objects.filter(user=user).annotate(
+        tamanho_display=tamanho_display,
+        fornecedores_nomes=StringAgg('fornecedores__nome', ', ', ordering='fornecedores__nome', default=Value('')),
+    ).order_by('nome', 'id').values_list(
+        'nome', 'vinicula', 'pais', 'uva', 'safra', 'tamanho_display', 'fornecedores_nomes', 'valor_custo', 'markup',
+        'preco_venda', 'estoque',
+    )
+    return wines.iterator(chunk_size=CHUNK_SIZE)
+
+
+def _chunks(rows):
+    rows = iter(rows)
+    while chunk := list(islice(rows, CHUNK_SIZE)):
+        yield chunk
+
+
+class _Echo:
+    # Pseudo-buffer para o csv.writer: devolve a linha formatada em vez de gravá-la
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    # BOM para o Excel reconhecer o UTF-8
+    yield '\ufeff' + writer.writerow(EXPORT_COLUMNS)
+    for chunk in _chunks(rows):
+        yield ''.join(writer.writerow(row) for row in chunk)
+
+
+def iter_ndjson(rows):
+    campos = [campo for campo, _ in EXPORT_FIELDS]
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for chunk in _chunks(rows):
+        yield ''.join(encoder.encode(dict(zip(campos, row))) + '\n' for row in chunk)
+
+
+def write_xlsx(rows, arquivo):
+    # Workbook write-only: as linhas vão direto para o arquivo, sem manter a planilha em memória
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Vinhos')
+    sheet.append(EXPORT_COLUMNS)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(arquivo)
+
+
+def write_parquet(rows, arquivo):
+    # Cada bloco de linhas é transposto em colunas e gravado como um record batch do Arrow
+    with pq.ParquetWriter(arquivo, PARQUET_SCHEMA) as writer:
+        for chunk in _chunks(rows):
+            writer.write_batch(pa.record_batch([list(coluna) for coluna in zip(*chunk)], schema=PARQUET_SCHEMA))
+
+
+# Formatos enviados enquanto são gerados e formatos que precisam ser fechados num arquivo antes do envio
+STREAM_WRITERS = {
+    'csv': iter_csv,
+    'ndjson': iter_ndjson,
+}
+FILE_WRITERS = {
+    'xlsx': write_xlsx,
+    'parquet': write_parquet,
+}
+
+
+def inventory_version(user):
+    # Geração do inventário (invalidada pelos sinais) + um agregado barato que também pega escritas em lote
+    stats = Wine.objects.filter(user=user).aggregate(
+        ultima_alteracao=Max('updated_at'),
+        total=Count('id', distinct=True),
+        fornecedores=Count('fornecedores'),
+    )
+    chave = f"{get_generation(INVENTORY, user.pk)}:{stats['ultima_alteracao']}:{stats['total']}:{stats['fornecedores']}"
+    return hashlib.sha1(chave.encode()).hexdigest()[:20]
+
+
+def export_cache_path(user, formato, version):
+    return os.path.join(settings.EXPORT_CACHE_DIR, str(user.pk), f"{formato}-{version}.{formato}")
+
+
+def _publicar(temporario, caminho):
+    # Troca atômica do arquivo e remoção das versões antigas do mesmo formato
+    os.replace(temporario, caminho)
+    formato = os.path.basename(caminho).split('-', 1)[0]
+    for antigo in glob.glob(os.path.join(os.path.dirname(caminho), f"{formato}-*.{formato}")):
+        if antigo != caminho:
+            try:
+                os.remove(antigo)
+            except FileNotFoundError:
+                pass
+
+
+def _temporario(caminho):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    return f"{caminho}.{uuid.uuid4().hex}.tmp"
+
+
+def store_stream(chunks, caminho):
+    # Repassa os blocos ao cliente e grava a mesma saída no cache; só publica se a exportação terminar
+    temporario = _temporario(caminho)
+    try:
+        with open(temporario, 'w', encoding='utf-8', newline='') as arquivo:
+            for chunk in chunks:
+                arquivo.write(chunk)
+                yield chunk
+    except BaseException:
+        os.remove(temporario)
+        raise
+    _publicar(temporario, caminho)
+
+
+def store_file(writer, rows, caminho):
+    temporario = _temporario(caminho)
+    try:
+        with open(temporario, 'wb') as arquivo:
+            writer(rows, arquivo)
+    except BaseException:
+        os.remove(temporario)
+        raise
+    _publicar(temporario, caminho)
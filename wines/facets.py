@@ -0,0 +1,102 @@
+import hashlib
+import json
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import BooleanField, Case, ExpressionWrapper, IntegerField, Value, When
+
+from wines.cache import INVENTORY, get_generation
+from wines.models import Wine
+from wines.search import FILTROS_MULTIPLOS, condicoes_filtros, filtro_busca
+
+# Limites das faixas de preço de venda: [0, 50), [50, 100), ..., [500, ∞)
+FAIXAS_PRECO = (Decimal('50'), Decimal('100'), Decimal('200'), Decimal('500'))
+
+# As entradas não precisam expirar cedo: a chave muda junto com a geração do inventário
+FACETAS_TIMEOUT = 60 * 60
+
+COLUNAS = FILTROS_MULTIPLOS + ('faixa_preco',)
+
+# Filtro de cada faceta (ver condicoes_filtros): a faceta conta os vinhos sem aplicar o próprio filtro
+FILTRO_DA_COLUNA = {**{coluna: coluna for coluna in FILTROS_MULTIPLOS}, 'faixa_preco': 'preco'}
+
+
+def _faixa_preco():
+    return Case(*[When(preco_venda__lt=limite, then=Value(i)) for i, limite in enumerate(FAIXAS_PRECO)],
+                default=Value(len(FAIXAS_PRECO)), output_field=IntegerField())
+
+
+def _contagens(queryset, condicoes=None):
+    """
+    Contagens de ``queryset`` por valor de cada coluna de ``COLUNAS`` numa
+    varredura só (GROUPING SETS, um grupo por coluna). ``condicoes`` são os
+    filtros da barra lateral (ver ``condicoes_filtros``), ainda não aplicados
+    a ``queryset``: cada coluna conta os vinhos que passam em todos menos no
+    seu, para que ?pais=Chile continue mostrando os outros países.
+    """
+    condicoes = condicoes or {}
+    marcas = {f'passa_{nome}': ExpressionWrapper(condicao, output_field=BooleanField())
+              for nome, condicao in condicoes.items()}
+    sql, params = (queryset.annotate(faixa_preco=_faixa_preco(), **marcas).values(*COLUNAS, *marcas).order_by()
+                   .query.sql_with_params())
+
+    totais = []
+    for coluna in COLUNAS:
+        outras = [f'passa_{nome}' for nome in condicoes if nome != FILTRO_DA_COLUNA[coluna]]
+        totais.append(f"COUNT(*) FILTER (WHERE {' AND '.join(outras) or 'TRUE'})")
+    # Vinho reprovado em dois filtros ou mais não conta em faceta nenhuma
+    reprovados = ' + '.join(f'(NOT {marca})::int' for marca in marcas) or '0'
+    colunas = ', '.join(COLUNAS)
+    grupos = ', '.join(f'({coluna})' for coluna in COLUNAS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT GROUPING({colunas}), {colunas}, {', '.join(totais)} FROM ({sql}) AS vinhos "
+            f"WHERE {reprovados} <= 1 GROUP BY GROUPING SETS ({grupos})",
+            params,
+        )
+        linhas = cursor.fetchall()
+
+    # GROUPING() liga o bit de cada coluna fora do grupo: o grupo da coluna i tem todos os bits menos o dela
+    todos = (1 << len(COLUNAS)) - 1
+    por_mascara = {todos ^ (1 << (len(COLUNAS) - 1 - i)): i for i in range(len(COLUNAS))}
+    contagens = {coluna: {} for coluna in COLUNAS}
+    for mascara, *valores in linhas:
+        i = por_mascara[mascara]
+        total = valores[len(COLUNAS) + i]
+        if total:
+            contagens[COLUNAS[i]][valores[i]] = total
+    return contagens
+
+
+def facetas(user, filtros):
+    """
+    Contagem de vinhos do usuário por país, uva, vinícula, safra, tamanho e
+    faixa de preço de venda, considerando a busca e os filtros aplicados (ver
+    ``condicoes_filtros``) menos o da própria faceta, numa única consulta. O
+    resultado fica no cache até a próxima escrita no inventário do usuário.
+    """
+    normalizados = json.dumps(filtros, sort_keys=True, default=str)
+    chave = (f"facetas:{user.pk}:{get_generation(INVENTORY, user.pk)}:"
+             f"{hashlib.sha1(normalizados.encode()).hexdigest()}")
+    resultado = cache.get(chave)
+    if resultado is not None:
+        return resultado
+
+    vinhos = Wine.objects.filter(user=user)
+    if filtros.get('q'):
+        vinhos = vinhos.filter(filtro_busca(filtros['q']))
+    contagens = _contagens(vinhos, condicoes_filtros(filtros))
+    resultado = {
+        coluna: [{'valor': valor, 'total': total}
+                 for valor, total in sorted(contagens[coluna].items(), key=lambda item: (-item[1], item[0]))]
+        for coluna in FILTROS_MULTIPLOS
+    }
+    limites = (None,) + FAIXAS_PRECO + (None,)
+    resultado['faixas_preco'] = [
+        {'preco_min': limites[i] or Decimal('0'), 'preco_max': limites[i + 1],
+         'total': contagens['faixa_preco'].get(i, 0)}
+        for i in range(len(FAIXAS_PRECO) + 1)
+    ]
+    cache.set(chave, resultado, FACETAS_TIMEOUT)
+    return resultado
@@ -0,0 +1,200 @@
+import hashlib
+import math
+import re
+import unicodedata
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from suppliers.models import Supplier
+from wines.cache import invalidate_inventory
+from wines.models import Wine
+from wines.pricing import get_markup_index
+from wines.validation import MAX_ERROS_RELATORIO, SUFIXO_SAFRA, TAMANHOS, validate_rows
+
+
+def _limpar(value):
+    # Células vazias chegam como None, NaN (pandas) ou strings em branco
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def _texto(value, default=''):
+    value = _limpar(value)
+    if value is None:
+        return default
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _decimal(value, default='0.0'):
+    value = _limpar(value)
+    try:
+        return Decimal(str(value if value is not None else default))
+    except InvalidOperation:
+        raise ValueError(f"'{value}' não é um número válido.")
+
+
+def _decimal_campo(value, campo):
+    # Já arredondado como o banco vai gravar: 40.419999999999995 (csv) e 40.41999999999999 (xlsx) viram 40.42
+    casas = Wine._meta.get_field(campo).decimal_places
+    return _decimal(value).quantize(Decimal(1).scaleb(-casas), rounding=ROUND_HALF_UP)
+
+
+# Campos regravados quando uma linha já importada muda (os demais formam a chave natural do vinho). O estoque
+# da planilha é só o inicial: num vinho existente ele muda por movimentos (ver wines.stock)
+UPSERT_FIELDS = ['pais', 'uva', 'valor_custo', 'markup', 'preco_venda', 'import_hash', 'updated_at']
+
+
+def natural_key(wine):
+    return wine.nome, wine.vinicula, wine.safra, wine.tamanho
+
+
+def _normalizar(texto):
+    # Mesma forma Unicode e espaços internos colapsados, venha a célula do csv ou do xlsx
+    return ' '.join(unicodedata.normalize('NFC', texto).split())
+
+
+def row_fingerprint(wine, fornecedores):
+    # Hash do conteúdo da linha, independente da ordem dos fornecedores; os decimais já vêm quantizados. Sem o
+    # estoque, que não é regravado: uma linha que só mudou no estoque é ignorada
+    textos = [wine.nome, wine.vinicula, wine.pais, wine.uva, wine.safra, wine.tamanho]
+    partes = [*map(_normalizar, textos), str(wine.valor_custo), str(wine.markup),
+              *sorted(map(_normalizar, fornecedores))]
+    return hashlib.sha1('\x1f'.join(partes).encode()).hexdigest()
+
+
+class WineImporter:
+    """
+    Importa as linhas da planilha em lote: fornecedores e regras de markup do
+    usuário são carregados uma única vez, o preço é calculado em memória com
+    o índice de faixas de pricing e os vinhos e a tabela vinho↔fornecedor são
+    gravados com bulk_create.
+
+    Com ``upsert=True`` cada linha é casada com o vinho existente pela chave
+    (nome, vinícola, safra, tamanho): linhas com o mesmo hash de conteúdo são
+    ignoradas e apenas as alteradas são regravadas com bulk_update.
+    """
+
+    def __init__(self, user, upsert=False):
+        self.user = user
+        self.upsert = upsert
+        self.suppliers = {supplier.nome: supplier for supplier in Supplier.objects.filter(user=user)}
+        self.markup_index = get_markup_index(user.pk)
+        self.criados = 0
+        self.atualizados = 0
+        self.ignorados = 0
+        # Linhas rejeitadas: [{'linha': n, 'erro': '...'}], só as primeiras MAX_ERROS_RELATORIO
+        self.erros = []
+        self.total_erros = 0
+
+    def _erro(self, linha, erro):
+        self.total_erros += 1
+        if len(self.erros) < MAX_ERROS_RELATORIO:
+            self.erros.append({'linha': linha, 'erro': erro})
+
+    def build_wine(self, row):
+        tamanho = _texto(row.get('Tamanho'), Wine.INTEIRA).lower()
+        wine = Wine(
+            user=self.user,
+            nome=_texto(row.get('Nome')),
+            vinicula=_texto(row.get('Vinícola')),
+            pais=_texto(row.get('País')),
+            uva=_texto(row.get('Uva')),
+            safra=re.sub(SUFIXO_SAFRA, '', _texto(row.get('Safra'))),
+            tamanho=TAMANHOS.get(tamanho, tamanho),
+            valor_custo=_decimal_campo(row.get('Valor de Custo'), 'valor_custo'),
+            markup=_decimal_campo(row.get('Markup'), 'markup'),
+            estoque=int(_decimal(row.get('Estoque'), '0')),
+        )
+        fornecedores = [nome.strip() for nome in _texto(row.get('Fornecedores')).split(',')]
+        fornecedores = list(dict.fromkeys(nome for nome in fornecedores if nome))
+
+        wine.import_hash = row_fingerprint(wine, fornecedores)
+        wine.calcular_preco_venda(self.markup_index.lookup(wine.valor_custo))
+        return wine, fornecedores
+
+    def _create_missing_suppliers(self, nomes):
+        faltando = [nome for nome in dict.fromkeys(nomes) if nome not in self.suppliers]
+        if not faltando:
+            return
+        # Fornecedores têm nome único por usuário: se outra importação criou o mesmo nome, o conflito é ignorado
+        Supplier.objects.bulk_create([Supplier(user=self.user, nome=nome) for nome in faltando], ignore_conflicts=True)
+        self.suppliers.update(
+            {supplier.nome: supplier for supplier in Supplier.objects.filter(user=self.user, nome__in=faltando)}
+        )
+
+    def _existing_wines(self, wines):
+        # Uma consulta por lote; a chave completa é conferida em memória. Se já houver vinhos repetidos com a
+        # mesma chave (cadastrados antes do upsert), a linha atualiza o mais recente
+        existentes = {}
+        candidatos = (Wine.objects.filter(user=self.user, nome__in={wine.nome for wine in wines})
+                      .order_by('-created_at', '-id'))
+        for wine in candidatos:
+            existentes.setdefault(natural_key(wine), wine)
+        return existentes
+
+    def import_rows(self, rows):
+        # ``rows`` são pares (numero_da_linha, linha) como os entregues por readers.iter_row_batches
+        # Linhas inválidas são detectadas de uma vez, coluna a coluna, e ficam de fora do lote
+        invalidas = validate_rows(rows)
+        lote = []
+        for linha, row in rows:
+            if linha in invalidas:
+                erro = ' '.join(f"{coluna}: {mensagem}" for coluna, mensagem in invalidas[linha].items())
+                self._erro(linha, erro)
+                continue
+            try:
+                lote.append(self.build_wine(row))
+            except ValueError as exc:
+                self._erro(linha, str(exc))
+
+        Through = Wine.fornecedores.through
+        with transaction.atomic():
+            existentes = {}
+            if self.upsert:
+                # Serializa importações concorrentes do mesmo usuário para não duplicar vinhos
+                type(self.user).objects.select_for_update().filter(pk=self.user.pk).exists()
+                existentes = self._existing_wines([wine for wine, _ in lote])
+                # Linhas repetidas na planilha: vale a última
+                lote = list({natural_key(wine): (wine, fornecedores) for wine, fornecedores in lote}.values())
+
+            novos, alterados, links = [], [], []
+            agora = timezone.now()
+            for wine, fornecedores in lote:
+                existente = existentes.get(natural_key(wine))
+                if existente is None:
+                    novos.append(wine)
+                elif existente.import_hash == wine.import_hash:
+                    self.ignorados += 1
+                    continue
+                else:
+                    for campo in UPSERT_FIELDS:
+                        setattr(existente, campo, getattr(wine, campo))
+                    existente.updated_at = agora
+                    alterados.append(existente)
+                    wine = existente
+                links.extend((wine.id, nome) for nome in fornecedores)
+
+            self._create_missing_suppliers(nome for _, nome in links)
+            Wine.objects.bulk_create(novos)
+            if alterados:
+                Wine.objects.bulk_update(alterados, UPSERT_FIELDS)
+                Through.objects.filter(wine_id__in=[wine.id for wine in alterados]).delete()
+            Through.objects.bulk_create(
+                [Through(wine_id=wine_id, supplier_id=self.suppliers[nome].id) for wine_id, nome in links]
+            )
+            # bulk_create/bulk_update não disparam sinais
+            invalidate_inventory(self.user.pk)
+
+        self.criados += len(novos)
+        self.atualizados += len(alterados)
+        return len(novos) + len(alterados)
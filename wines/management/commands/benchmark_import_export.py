@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from users.models import CustomUser
+from wines.benchmark import compare, measure, write_workbook
+from wines.exporters import FILE_WRITERS, STREAM_WRITERS, wine_rows
+from wines.models import ImportJob
+from wines.tasks import processar_importacao
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede tempo, pico de memória e número de consultas da importação e da exportação de vinhos "
+        "com planilhas sintéticas, num banco PostgreSQL descartável, e compara com um baseline salvo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000],
+                            help="Quantidade de vinhos de cada planilha (ex.: --sizes 1000 10000 100000).")
+        parser.add_argument('--file-format', choices=['xlsx', 'csv'], default='xlsx',
+                            help="Formato da planilha importada.")
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'benchmark_baseline.json'),
+                            help="Arquivo JSON com o baseline.")
+        parser.add_argument('--save-baseline', action='store_true',
+                            help="Grava os resultados desta execução como novo baseline.")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Aumento relativo de tempo/memória tolerado antes de acusar regressão.")
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help="Termina com erro se houver regressão em relação ao baseline.")
+        parser.add_argument('--keepdb', action='store_true',
+                            help="Reaproveita o banco de teste entre execuções.")
+
+    def handle(self, *args, **options):
+        # Tudo roda no banco de teste (test_<PGDATABASE>), criado e migrado aqui e descartado no final
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            with tempfile.TemporaryDirectory() as tmp, override_settings(MEDIA_ROOT=tmp):
+                resultados = {str(size): self.run_size(size, options['file_format'], tmp) for size in options['sizes']}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        baseline = {}
+        if os.path.exists(options['baseline']):
+            with open(options['baseline']) as arquivo:
+                baseline = json.load(arquivo)
+        self.report(resultados, baseline)
+
+        regressoes = compare(resultados, baseline, options['tolerance'])
+        for tamanho, cenario, metrica, anterior, atual in regressoes:
+            self.stdout.write(self.style.ERROR(
+                f"REGRESSÃO {tamanho} {cenario} {metrica}: {anterior} -> {atual}"
+            ))
+
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as arquivo:
+                json.dump({**baseline, **resultados}, arquivo, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Baseline salvo em {options['baseline']}"))
+
+        if regressoes and options['fail_on_regression']:
+            raise CommandError(f"{len(regressoes)} regressão(ões) em relação ao baseline.")
+
+    def run_size(self, size, file_format, tmp):
+        self.stdout.write(f"Gerando planilha com {size} vinhos...")
+        caminho = write_workbook(os.path.join(tmp, f"vinhos_{size}.{file_format}"), size)
+        user = CustomUser.objects.create(username=f"benchmark-{uuid.uuid4().hex[:8]}")
+        resultados = {}
+
+        try:
+            for cenario, upsert in (('import', False), ('reimport_upsert', True)):
+                with open(caminho, 'rb') as arquivo:
+                    job = ImportJob.objects.create(user=user, upsert=upsert,
+                                                   arquivo=File(arquivo, name=os.path.basename(caminho)))
+                resultados[cenario] = {}
+                with measure(resultados[cenario]):
+                    processar_importacao(job.pk)
+                job.refresh_from_db()
+                if job.status != ImportJob.DONE:
+                    raise CommandError(f"Importação de {size} vinhos falhou: {job.mensagem}")
+
+            for formato, writer in {**STREAM_WRITERS, **FILE_WRITERS}.items():
+                cenario = f"export_{formato}"
+                resultados[cenario] = {}
+                with tempfile.TemporaryFile() as saida, measure(resultados[cenario]):
+                    if formato in STREAM_WRITERS:
+                        for chunk in writer(wine_rows(user)):
+                            saida.write(chunk.encode())
+                    else:
+                        writer(wine_rows(user), saida)
+        finally:
+            user.delete()
+        return resultados
+
+    def report(self, resultados, baseline):
+        self.stdout.write(f"{'vinhos':>8} {'cenário':<18} {'tempo (s)':>10} {'Δ':>7} {'memória (MB)':>13} {'Δ':>7} "
+                          f"{'queries':>8} {'Δ':>5}")
+        for tamanho, cenarios in resultados.items():
+            for cenario, metricas in cenarios.items():
+                anterior = baseline.get(tamanho, {}).get(cenario, {})
+                self.stdout.write(
+                    f"{tamanho:>8} {cenario:<18} {metricas['tempo_s']:>10.3f} "
+                    f"{self._delta(metricas['tempo_s'], anterior.get('tempo_s')):>7} "
+                    f"{metricas['memoria_pico_mb']:>13.2f} "
+                    f"{self._delta(metricas['memoria_pico_mb'], anterior.get('memoria_pico_mb')):>7} "
+                    f"{metricas['queries']:>8} "
+                    f"{metricas['queries'] - anterior['queries'] if 'queries' in anterior else '':>5}"
+                )
+
+    @staticmethod
+    def _delta(atual, anterior):
+        if not anterior:
+            return ''
+        return f"{(atual - anterior) / anterior:+.0%}"
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-17 11:38
+
+import django.db.models.deletion
+import uuid
+import wines.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wines', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('arquivo', models.FileField(upload_to=wines.models.import_upload_to)),
+                ('status', models.CharField(choices=[('queued', 'Na fila'), ('running', 'Em andamento'), ('done', 'Concluída'), ('failed', 'Falhou')], default='queued', max_length=10)),
+                ('linhas_processadas', models.PositiveIntegerField(default=0)),
+                ('linhas_importadas', models.PositiveIntegerField(default=0)),
+                ('erros', models.JSONField(blank=True, default=list, help_text="Erros por linha: [{'linha': n, 'erro': '...'}]")),
+                ('mensagem', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.6 on 2026-10-17 11:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('suppliers', '0003_unique_supplier_nome'),
+        ('wines', '0002_importjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='linhas_atualizadas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='linhas_ignoradas',
+            field=models.PositiveIntegerField(default=0, help_text='Linhas sem alteração desde a última importação'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='upsert',
+            field=models.BooleanField(default=False, help_text='Atualiza vinhos já existentes em vez de duplicá-los'),
+        ),
+        migrations.AddField(
+            model_name='wine',
+            name='import_hash',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Hash do conteúdo da última linha de planilha importada para este vinho', max_length=40),
+        ),
+        migrations.AddIndex(
+            model_name='wine',
+            index=models.Index(fields=['user', 'nome', 'vinicula', 'safra', 'tamanho'], name='wine_natural_key_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.0.6 on 2026-10-17 11:53
+
+import django.contrib.postgres.constraints
+from django.contrib.postgres.operations import BtreeGistExtension
+import wines.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+def sobreposicoes(regras):
+    """
+    Pares de faixas sobrepostas (como ``[min, max)``, a semântica da
+    ExclusionConstraint) em ``regras``: tuplas ``(id, user_id, min_price,
+    max_price)``. Faixas vazias não se sobrepõem a nada.
+    """
+    pares = []
+    maior = {}  # user_id -> regra com o maior max_price vista até aqui
+    for regra in sorted(regras, key=lambda regra: (regra[1], regra[2], regra[0])):
+        _, user_id, min_price, max_price = regra
+        if min_price >= max_price:
+            continue
+        anterior = maior.get(user_id)
+        if anterior is not None and min_price < anterior[3]:
+            pares.append((anterior, regra))
+        if anterior is None or max_price > anterior[3]:
+            maior[user_id] = regra
+    return pares
+
+
+def verificar_faixas(apps, schema_editor):
+    # Faixas invertidas (min > max) nunca casavam com nenhum custo no filtro antigo (min <= custo <= max):
+    # apagá-las não muda nenhum preço. Sobreposições não têm reparo seguro (qual percentual vale?), então a
+    # migração para e lista as regras para que o dono escolha; ver "Faixas de markup" no README
+    MarkupRule = apps.get_model('wines', 'MarkupRule')
+    MarkupRule.objects.filter(min_price__gt=models.F('max_price')).delete()
+
+    pares = sobreposicoes(MarkupRule.objects.values_list('id', 'user_id', 'min_price', 'max_price'))
+    if pares:
+        linhas = [f"user {a[1]}: rule {a[0]} [{a[2]}, {a[3]}) overlaps rule {b[0]} [{b[2]}, {b[3]})" for a, b in pares]
+        raise RuntimeError("Overlapping markup rules must be fixed before this migration:\n" + "\n".join(linhas))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wines', '0003_import_upsert'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Índice GiST com igualdade no user (uuid) exige btree_gist
+        BtreeGistExtension(),
+        migrations.RunPython(verificar_faixas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='markuprule',
+            constraint=models.CheckConstraint(check=models.Q(('min_price__lte', models.F('max_price'))), name='markup_rule_min_lte_max'),
+        ),
+        migrations.AddConstraint(
+            model_name='markuprule',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[('user', '='), (wines.models.NumRange('min_price', 'max_price', models.Value('[)')), '&&')], name='exclude_overlapping_markup_rules', violation_error_message='This markup rule overlaps with an existing rule.'),
+        ),
+    ]
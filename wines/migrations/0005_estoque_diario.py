@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-17 11:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wines', '0004_markup_rule_exclusion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstoqueDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('estoque', models.IntegerField(help_text='Estoque no fim do dia')),
+                ('entradas', models.PositiveIntegerField(default=0)),
+                ('saidas', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='movimentoestoque',
+            index=models.Index(fields=['vinho', 'data_movimento'], name='movimento_vinho_data_idx'),
+        ),
+        migrations.AddField(
+            model_name='estoquediario',
+            name='vinho',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estoques_diarios', to='wines.wine'),
+        ),
+        migrations.AddConstraint(
+            model_name='estoquediario',
+            constraint=models.UniqueConstraint(fields=('vinho', 'data'), name='unique_estoque_diario_vinho_data'),
+        ),
+    ]
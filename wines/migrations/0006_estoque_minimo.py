@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-17 11:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('suppliers', '0003_unique_supplier_nome'),
+        ('wines', '0005_estoque_diario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wine',
+            name='estoque_minimo',
+            field=models.PositiveIntegerField(blank=True, help_text='Alerta de reposição quando o estoque chega a este valor; vazio usa o estoque mínimo padrão do usuário', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='wine',
+            index=models.Index(condition=models.Q(('estoque__lte', models.F('estoque_minimo'))), fields=['user'], name='wine_estoque_baixo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wine',
+            index=models.Index(condition=models.Q(('estoque_minimo__isnull', True)), fields=['user', 'estoque'], name='wine_estoque_padrao_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copiar_user_do_vinho(apps, schema_editor):
+    MovimentoEstoque = apps.get_model('wines', 'MovimentoEstoque')
+    Wine = apps.get_model('wines', 'Wine')
+    MovimentoEstoque.objects.update(
+        user_id=models.Subquery(Wine.objects.filter(pk=models.OuterRef('vinho_id')).values('user_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wines', '0006_estoque_minimo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimentoestoque',
+            name='user',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE,
+                                    related_name='movimentos', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(copiar_user_do_vinho, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('suppliers', '0004_supplier_created_at'),
+        ('wines', '0007_movimentoestoque_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movimentoestoque',
+            name='user',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='movimentos', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='movimentoestoque',
+            index=models.Index(fields=['user', 'data_movimento', 'id'], name='movimento_user_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wine',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='wine_user_created_idx'),
+        ),
+    ]
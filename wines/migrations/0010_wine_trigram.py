@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:09
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('suppliers', '0004_supplier_created_at'),
+        ('wines', '0009_wine_busca'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Operadores e classes de operadores de similaridade (%, <%, gin_trgm_ops)
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='wine',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['nome'], name='wine_nome_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='wine',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['vinicula'], name='wine_vinicula_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wines', '0010_wine_trigram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='markuprule',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
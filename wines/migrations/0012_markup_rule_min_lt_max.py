@@ -0,0 +1,34 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def verificar_faixas_vazias(apps, schema_editor):
+    # Faixa com min == max valia só para o custo exato no filtro antigo; não há faixa equivalente com
+    # min < max, então a migração para e lista as regras (ver "Faixas de markup" no README)
+    MarkupRule = apps.get_model('wines', 'MarkupRule')
+    vazias = MarkupRule.objects.filter(min_price__gte=models.F('max_price')).values_list('id', 'user_id', 'min_price')
+    if vazias:
+        linhas = [f"user {user_id}: rule {pk} has min_price = max_price = {preco}" for pk, user_id, preco in vazias]
+        raise RuntimeError("Empty markup rules must be fixed before this migration:\n" + "\n".join(linhas))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wines', '0011_markuprule_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(verificar_faixas_vazias, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='markuprule',
+            name='markup_rule_min_lte_max',
+        ),
+        migrations.AddConstraint(
+            model_name='markuprule',
+            constraint=models.CheckConstraint(check=models.Q(('min_price__lt', models.F('max_price'))), name='markup_rule_min_lt_max'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wines', '0012_markup_rule_min_lt_max'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='linhas_com_erro',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='erros',
+            field=models.JSONField(blank=True, default=list, help_text="Erros das primeiras linhas rejeitadas: [{'linha': n, 'erro': '...'}]"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:48
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wines', '0013_importjob_linhas_com_erro'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='markuprule',
+            name='updated_at',
+        ),
+    ]
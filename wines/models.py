@@ -2,6 +2,10 @@ import os
 import uuid
 from decimal import Decimal
 
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import DecimalRangeField, RangeOperators
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
@@ -46,21 +50,47 @@ class Wine(models.Model):
     markup = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal('0.0'), editable=False)
     preco_venda = models.DecimalField(max_digits=10, decimal_places=2, blank=True, editable=False)
     estoque = models.PositiveIntegerField(default=0)
+    estoque_minimo = models.PositiveIntegerField(blank=True, null=True,
+                                                 help_text="Alerta de reposição quando o estoque chega a este valor; "
+                                                           "vazio usa o estoque mínimo padrão do usuário")
     descricao = models.TextField(blank=True, null=True)
+    import_hash = models.CharField(max_length=40, blank=True, default='', editable=False,
+                                   help_text="Hash do conteúdo da última linha de planilha importada para este vinho")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Documento da busca textual (?q=), mantido pelo próprio Postgres (ver wines.search)
+    busca = models.GeneratedField(
+        expression=(
+            SearchVector('nome', weight='A', config='simple')
+            + SearchVector('vinicula', weight='B', config='simple')
+            + SearchVector('uva', 'pais', weight='C', config='simple')
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
-    def save(self, *args, **kwargs):
-        # Find the applicable markup rule
-        applicable_rule = self.user.markup_rules.filter(min_price__lte=self.valor_custo,
-                                                        max_price__gte=self.valor_custo).first()
-        if applicable_rule:
-            self.markup = applicable_rule.percentage
+    class Meta:
+        indexes = [
+            GinIndex(fields=['busca'], name='wine_busca_idx'),
+            # Trigramas para a busca aproximada (erros de digitação) por nome e vinícola
+            GinIndex(fields=['nome'], opclasses=['gin_trgm_ops'], name='wine_nome_trgm_idx'),
+            GinIndex(fields=['vinicula'], opclasses=['gin_trgm_ops'], name='wine_vinicula_trgm_idx'),
+            # Chave natural usada pela importação em modo upsert
+            models.Index(fields=['user', 'nome', 'vinicula', 'safra', 'tamanho'], name='wine_natural_key_idx'),
+            # Alertas de estoque baixo (ver wines.stock.vinhos_estoque_baixo): só entram no índice os vinhos
+            # abaixo do próprio mínimo, e os sem mínimo próprio ficam ordenados por estoque
+            models.Index(fields=['user'], condition=models.Q(estoque__lte=models.F('estoque_minimo')),
+                         name='wine_estoque_baixo_idx'),
+            models.Index(fields=['user', 'estoque'], condition=models.Q(estoque_minimo__isnull=True),
+                         name='wine_estoque_padrao_idx'),
+            # Paginação por cursor da listagem de vinhos
+            models.Index(fields=['user', 'created_at', 'id'], name='wine_user_created_idx'),
+        ]
 
-        # Garantir que ambos os valores sejam Decimal
-        valor_custo_decimal = Decimal(self.valor_custo)
-        markup_decimal = Decimal(self.markup)
-        self.preco_venda = valor_custo_decimal * (Decimal('1.0') + markup_decimal / Decimal('100'))
+    def save(self, *args, **kwargs):
+        # Find the applicable markup rule (cached per-user index, no query)
+        from wines.pricing import get_markup_index
+        self.calcular_preco_venda(get_markup_index(self.user_id).lookup(Decimal(self.valor_custo)))
 
         # Handle image compression
         if not self._state.adding:
@@ -70,10 +100,25 @@ class Wine(models.Model):
                     old_instance.imagem.delete(save=False)
             except Wine.DoesNotExist:
                 pass
+            # estoque só muda por movimento (UPDATE com F('estoque')); regravar o valor lido aqui desfaria
+            # um movimento registrado entre a leitura e o save
+            if kwargs.get('update_fields') is None:
+                kwargs['update_fields'] = [campo.name for campo in self._meta.concrete_fields
+                                           if not (campo.primary_key or campo.generated or campo.name == 'estoque')]
         super(Wine, self).save(*args, **kwargs)
         if self.imagem:
             self.compress_image()
 
+    def calcular_preco_venda(self, percentage=None):
+        # Aplica o percentual da regra de markup (quando houver) e recalcula o preço de venda
+        if percentage is not None:
+            self.markup = percentage
+
+        # Garantir que ambos os valores sejam Decimal
+        valor_custo_decimal = Decimal(self.valor_custo)
+        markup_decimal = Decimal(self.markup)
+        self.preco_venda = valor_custo_decimal * (Decimal('1.0') + markup_decimal / Decimal('100'))
+
     def compress_image(self):
         image = Image.open(self.imagem.path)
         image = image.convert('RGB')  # Convert to RGB if the image is in a different mode
@@ -93,14 +138,56 @@ class MovimentoEstoque(models.Model):
     ]
 
     vinho = models.ForeignKey(Wine, on_delete=models.CASCADE)
+    # Cópia de vinho.user: a listagem do usuário é filtrada e paginada sem join com Wine
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='movimentos',
+                             editable=False)
     tipo = models.CharField(max_length=10, choices=MOVIMENTO_CHOICES)
     quantidade = models.PositiveIntegerField()
     data_movimento = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Movimentos de um vinho num intervalo de datas (fechamento diário e histórico de estoque)
+            models.Index(fields=['vinho', 'data_movimento'], name='movimento_vinho_data_idx'),
+            # Paginação por cursor da listagem de movimentos
+            models.Index(fields=['user', 'data_movimento', 'id'], name='movimento_user_data_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.user_id is None:
+            self.user_id = self.vinho.user_id
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.tipo} - {self.quantidade} - {self.vinho.nome}"
 
 
+class EstoqueDiario(models.Model):
+    # Fechamento do estoque de um vinho num dia em que houve movimento (ver wines.stock.consolidar_dia)
+    vinho = models.ForeignKey(Wine, on_delete=models.CASCADE, related_name='estoques_diarios')
+    data = models.DateField()
+    estoque = models.IntegerField(help_text="Estoque no fim do dia")
+    entradas = models.PositiveIntegerField(default=0)
+    saidas = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['vinho', 'data'], name='unique_estoque_diario_vinho_data'),
+        ]
+
+    def __str__(self):
+        return f"{self.vinho.nome} - {self.data}: {self.estoque}"
+
+
+MARKUP_OVERLAP_ERROR = "This markup rule overlaps with an existing rule."
+MARKUP_BOUNDS_ERROR = "min_price must be less than max_price."
+
+
+class NumRange(models.Func):
+    function = 'numrange'
+    output_field = DecimalRangeField()
+
+
 class MarkupRule(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='markup_rules')
     min_price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -109,17 +196,25 @@ class MarkupRule(models.Model):
 
     class Meta:
         unique_together = ('user', 'min_price', 'max_price')
+        constraints = [
+            # Faixa vazia ([50, 50)) não sobrepõe nada na ExclusionConstraint: min_price tem de ser menor
+            models.CheckConstraint(check=models.Q(min_price__lt=models.F('max_price')),
+                                   name='markup_rule_min_lt_max'),
+            # Faixas do mesmo usuário não se sobrepõem; como [min, max), duas faixas podem se tocar no limite
+            ExclusionConstraint(
+                name='exclude_overlapping_markup_rules',
+                expressions=[
+                    ('user', RangeOperators.EQUAL),
+                    (NumRange('min_price', 'max_price', models.Value('[)')), RangeOperators.OVERLAPS),
+                ],
+                violation_error_message=MARKUP_OVERLAP_ERROR,
+            ),
+        ]
 
     def clean(self):
-        # Ensure no overlapping ranges
-        overlapping_rules = MarkupRule.objects.filter(
-            user=self.user,
-            min_price__lt=self.max_price,
-            max_price__gt=self.min_price
-        ).exclude(pk=self.pk)
-
-        if overlapping_rules.exists():
-            raise ValidationError("This markup rule overlaps with an existing rule.")
+        # A sobreposição com outras faixas é garantida pela ExclusionConstraint
+        if self.min_price >= self.max_price:
+            raise ValidationError(MARKUP_BOUNDS_ERROR)
 
     def save(self, *args, **kwargs):
         self.clean()
@@ -127,3 +222,43 @@ class MarkupRule(models.Model):
 
     def __str__(self):
         return f"{self.min_price} - {self.max_price}: {self.percentage}%"
+
+
+def import_upload_to(instance, filename):
+    return os.path.join('imports/', str(instance.user.id), f"{instance.id}_{filename}")
+
+
+class ImportJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Na fila'),
+        (RUNNING, 'Em andamento'),
+        (DONE, 'Concluída'),
+        (FAILED, 'Falhou'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='import_jobs')
+    arquivo = models.FileField(upload_to=import_upload_to)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    upsert = models.BooleanField(default=False, help_text="Atualiza vinhos já existentes em vez de duplicá-los")
+    linhas_processadas = models.PositiveIntegerField(default=0)
+    linhas_importadas = models.PositiveIntegerField(default=0)
+    linhas_atualizadas = models.PositiveIntegerField(default=0)
+    linhas_ignoradas = models.PositiveIntegerField(default=0, help_text="Linhas sem alteração desde a última importação")
+    linhas_com_erro = models.PositiveIntegerField(default=0)
+    erros = models.JSONField(default=list, blank=True,
+                             help_text="Erros das primeiras linhas rejeitadas: [{'linha': n, 'erro': '...'}]")
+    mensagem = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.arquivo.name} - {self.status}"
@@ -0,0 +1,185 @@
+from bisect import bisect_right
+from functools import partial
+
+import numpy as np
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, Q, Value, When
+from django.db.models import FloatField
+from django.db.models.functions import Cast, Now
+
+from wines.cache import bump_generation, get_generation, invalidate_inventory
+from wines.models import MarkupRule, Wine
+
+# Geração das regras de markup de cada usuário: muda a cada escrita em MarkupRule
+MARKUP_RULES = 'markup_rules'
+
+# Índices já montados neste processo: {user_id: (geração, MarkupIndex)}
+_indexes = {}
+
+
+class MarkupIndex:
+    """
+    Faixas de markup de um usuário ordenadas por ``min_price``. As faixas não
+    se sobrepõem (ver ``MarkupRule.clean``), então a busca é um ``bisect``
+    sobre os limites inferiores: O(log n) e nenhuma consulta ao banco.
+    """
+
+    def __init__(self, rules):
+        rules = sorted(rules, key=lambda rule: (rule.min_price, rule.pk))
+        self.min_prices = [rule.min_price for rule in rules]
+        self.max_prices = [rule.max_price for rule in rules]
+        self.percentages = [rule.percentage for rule in rules]
+        self.pks = [rule.pk for rule in rules]
+
+    def __len__(self):
+        return len(self.pks)
+
+    def lookup(self, valor_custo):
+        # Percentual da faixa que contém valor_custo (limites inclusivos) ou None
+        i = bisect_right(self.min_prices, valor_custo) - 1
+        if i < 0 or valor_custo > self.max_prices[i]:
+            return None
+        # Faixas que só se tocam no limite: vale a mais antiga, como no filtro original ordenado por pk
+        if i > 0 and valor_custo <= self.max_prices[i - 1] and self.pks[i - 1] < self.pks[i]:
+            i -= 1
+        return self.percentages[i]
+
+    def bands(self):
+        # (min_price, max_price, percentage) das faixas, da regra mais antiga para a mais nova
+        faixas = zip(self.pks, self.min_prices, self.max_prices, self.percentages)
+        return [faixa[1:] for faixa in sorted(faixas)]
+
+
+def get_markup_index(user_id):
+    # Uma leitura no cache compartilhado (nenhuma consulta ao banco) quando o índice deste processo está em dia
+    geracao = get_generation(MARKUP_RULES, user_id)
+    cached = _indexes.get(user_id)
+    if cached is not None and cached[0] == geracao:
+        return cached[1]
+
+    index = MarkupIndex(MarkupRule.objects.filter(user_id=user_id))
+    _indexes[user_id] = (geracao, index)
+    return index
+
+
+def invalidate_markup_index(user_id):
+    # Descarta o índice local já e, depois do commit, o dos demais processos (web e worker), que leem a
+    # geração do mesmo cache (ver CACHES nas settings)
+    _indexes.pop(user_id, None)
+    transaction.on_commit(partial(bump_generation, MARKUP_RULES, user_id))
+
+
+def reprice_wines(user_id):
+    """
+    Recalcula ``markup`` e ``preco_venda`` de todos os vinhos do usuário cujo
+    custo cai numa faixa de markup, num único UPDATE com um CASE sobre as
+    faixas. Vinhos fora de todas as faixas mantêm o markup atual, como em
+    ``Wine.save()``. Retorna quantos vinhos mudaram.
+    """
+    faixas = get_markup_index(user_id).bands()
+    if not faixas:
+        return 0
+
+    # Na ordem das regras: num limite compartilhado por duas faixas vale a mais antiga, como no índice
+    markup = Case(
+        *[When(valor_custo__gte=minimo, valor_custo__lte=maximo, then=Value(percentual))
+          for minimo, maximo, percentual in faixas],
+        default=F('markup'),
+        output_field=DecimalField(max_digits=5, decimal_places=2),
+    )
+    preco_venda = ExpressionWrapper(
+        F('valor_custo') * (Value(1) + markup / Value(100)),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+    dentro_de_alguma_faixa = Q()
+    for minimo, maximo, _ in faixas:
+        dentro_de_alguma_faixa |= Q(valor_custo__gte=minimo, valor_custo__lte=maximo)
+
+    atualizados = (
+        Wine.objects.filter(dentro_de_alguma_faixa, user_id=user_id)
+        .exclude(markup=markup)
+        .update(markup=markup, preco_venda=preco_venda, updated_at=Now())
+    )
+    if atualizados:
+        # update() não dispara sinais
+        invalidate_inventory(user_id)
+    return atualizados
+
+
+def replace_markup_rules(user, bands):
+    """
+    Troca todas as faixas de markup do usuário por ``bands`` numa única
+    transação e reprecifica os vinhos uma vez só, depois do commit.
+    """
+    with transaction.atomic():
+        # Serializa trocas concorrentes do mesmo usuário
+        type(user).objects.select_for_update().filter(pk=user.pk).exists()
+        MarkupRule.objects.filter(user=user).delete()
+        # bulk_create preserva a ordem: a primeira faixa da lista fica com o menor pk
+        regras = MarkupRule.objects.bulk_create([MarkupRule(user=user, **band) for band in bands])
+        # bulk_create não dispara sinais
+        invalidate_markup_index(user.pk)
+        invalidate_inventory(user.pk)
+    return regras, reprice_wines(user.pk)
+
+
+def _totais(custo, preco, estoque):
+    receita = float(preco @ estoque)
+    custo_total = float(custo @ estoque)
+    margem = receita - custo_total
+    return {
+        'receita': round(receita, 2),
+        'custo': round(custo_total, 2),
+        'margem': round(margem, 2),
+        'margem_percentual': round(margem / receita * 100, 2) if receita else None,
+        'preco_medio': round(float(preco.mean()), 2) if len(preco) else None,
+    }
+
+
+def simulate_pricing(user_id, bands, bins=20):
+    """
+    Simula a aplicação de um conjunto de faixas de markup (dicts com
+    ``min_price``, ``max_price`` e ``percentage``, da mais antiga para a mais
+    nova) a todo o estoque do usuário, sem gravar nada. Os vinhos são lidos
+    numa única consulta e as faixas são aplicadas com ``np.searchsorted``.
+    """
+    colunas = [Cast(campo, FloatField()) for campo in ('valor_custo', 'markup', 'preco_venda')]
+    linhas = list(Wine.objects.filter(user_id=user_id).values_list(*colunas, 'estoque'))
+    dados = np.array(linhas, dtype=np.float64).reshape(-1, 4)
+    custo, markup_atual, preco_atual, estoque = dados.T
+
+    # Faixas ordenadas pelo limite inferior; "ordem" é a posição original, usada no desempate
+    ordem = np.argsort([float(band['min_price']) for band in bands], kind='stable').astype(np.int64)
+    minimos = np.array([float(bands[i]['min_price']) for i in ordem], dtype=np.float64)
+    maximos = np.array([float(bands[i]['max_price']) for i in ordem], dtype=np.float64)
+    percentuais = np.array([float(bands[i]['percentage']) for i in ordem], dtype=np.float64)
+
+    markup = markup_atual.copy()
+    if len(bands) and len(custo):
+        i = np.searchsorted(minimos, custo, side='right') - 1
+        valido = i >= 0
+        i = np.clip(i, 0, None)
+        # Faixas que só se tocam no limite: vale a mais antiga, como em MarkupIndex.lookup
+        anterior = np.clip(i - 1, 0, None)
+        empate = valido & (i > 0) & (custo <= maximos[anterior]) & (ordem[anterior] < ordem[i])
+        i = np.where(empate, anterior, i)
+        dentro = valido & (custo <= maximos[i])
+        markup[dentro] = percentuais[i[dentro]]
+    preco = np.round(custo * (1 + markup / 100), 2)
+
+    if len(custo):
+        limites = np.histogram_bin_edges(np.concatenate([preco_atual, preco]), bins=bins)
+    else:
+        limites = np.array([])
+    return {
+        'total_vinhos': len(custo),
+        'vinhos_alterados': int(np.count_nonzero(preco != preco_atual)),
+        'atual': _totais(custo, preco_atual, estoque),
+        'proposto': _totais(custo, preco, estoque),
+        'histograma_precos': {
+            'limites': np.round(limites, 2).tolist(),
+            'atual': np.histogram(preco_atual, bins=limites)[0].tolist() if len(custo) else [],
+            'proposto': np.histogram(preco, bins=limites)[0].tolist() if len(custo) else [],
+        },
+    }
@@ -0,0 +1,118 @@
+import csv
+import io
+from zipfile import BadZipFile
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from python_calamine import CalamineError
+
+# Quantidade de linhas entregues por lote ao importador
+BATCH_SIZE = 1000
+
+
+def _cabecalho(values):
+    return [str(value).strip() if value is not None else '' for value in values]
+
+
+def _vazia(values):
+    return all(value is None or (isinstance(value, str) and not value.strip()) for value in values)
+
+
+def _linhas_xlsx(arquivo):
+    # Modo read-only: o openpyxl lê a planilha linha a linha sem carregar o workbook inteiro
+    try:
+        workbook = load_workbook(arquivo, read_only=True, data_only=True)
+    except (InvalidFileException, BadZipFile, KeyError, OSError) as exc:
+        raise ValueError("Arquivo inválido: envie uma planilha .xlsx ou um arquivo .csv.") from exc
+
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        colunas = _cabecalho(next(rows, ()))
+        for numero, values in enumerate(rows, start=2):
+            if not _vazia(values):
+                yield numero, dict(zip(colunas, values))
+    finally:
+        workbook.close()
+
+
+def _dialeto(amostra):
+    try:
+        return csv.Sniffer().sniff(amostra, delimiters=',;\t')
+    except csv.Error:
+        return csv.excel
+
+
+def _linhas_csv(arquivo):
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    try:
+        amostra = texto.read(4096)
+        texto.seek(0)
+        dialect = _dialeto(amostra)
+
+        reader = csv.reader(texto, dialect)
+        colunas = _cabecalho(next(reader, ()))
+        for values in reader:
+            if not _vazia(values):
+                yield reader.line_num, dict(zip(colunas, values))
+    finally:
+        # Não fechar o arquivo enviado junto com o wrapper
+        texto.detach()
+
+
+def _csv(arquivo):
+    nome = (getattr(arquivo, 'name', '') or '').lower()
+    content_type = getattr(arquivo, 'content_type', '') or ''
+    return nome.endswith('.csv') or content_type in ('text/csv', 'application/csv')
+
+
+def iter_row_batches(arquivo, batch_size=BATCH_SIZE):
+    """
+    Lê o arquivo enviado (.xlsx ou .csv) em streaming e entrega lotes de até
+    ``batch_size`` pares ``(numero_da_linha, linha)``, onde ``linha`` é um dict
+    indexado pelos cabeçalhos da planilha ('Nome', 'Vinícola', ...).
+    """
+    if _csv(arquivo):
+        linhas = _linhas_csv(arquivo)
+    else:
+        linhas = _linhas_xlsx(arquivo)
+
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= batch_size:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def read_frame(arquivo):
+    """
+    Lê o arquivo enviado (.xlsx ou .csv) inteiro num DataFrame de texto, com
+    as colunas nomeadas pelos cabeçalhos da planilha, sem passar por um dict
+    por linha como ``iter_row_batches``. Retorna ``(numeros_das_linhas,
+    frame)``, já sem as linhas em branco. Usado onde a planilha toda cabe em memória e
+    é tratada coluna a coluna (dry-run).
+    """
+    if _csv(arquivo):
+        amostra = arquivo.read(4096).decode('utf-8-sig', errors='ignore')
+        arquivo.seek(0)
+        dialect = _dialeto(amostra)
+        # Linhas em branco mantidas (e descartadas abaixo) para que o índice dê o número da linha no arquivo
+        frame = pd.read_csv(arquivo, sep=dialect.delimiter, quotechar=dialect.quotechar, dtype=str,
+                            keep_default_na=False, skip_blank_lines=False, encoding='utf-8-sig')
+    else:
+        try:
+            frame = pd.read_excel(arquivo, engine='calamine', dtype=object)
+        except (CalamineError, ValueError) as exc:
+            raise ValueError("Arquivo inválido: envie uma planilha .xlsx ou um arquivo .csv.") from exc
+
+    frame.columns = _cabecalho(frame.columns)
+    # Tudo como texto, sem espaços nas pontas e com as células vazias como NA
+    frame = frame.astype('string').apply(lambda coluna: coluna.str.strip()).replace('', pd.NA)
+    # Índice 0 é a linha 2 da planilha (a 1 é o cabeçalho)
+    linhas = np.arange(2, len(frame) + 2)
+    preenchidas = frame.notna().any(axis=1).to_numpy()
+    return linhas[preenchidas], frame[preenchidas].reset_index(drop=True)
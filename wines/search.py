@@ -0,0 +1,59 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast, Greatest
+
+# Abaixo disso quase todo nome tem algum trigrama em comum com o termo
+MIN_TERMO_APROXIMADO = 3
+
+# Filtros do catálogo que aceitam vários valores (?pais=Chile&pais=Brasil)
+FILTROS_MULTIPLOS = ('pais', 'uva', 'vinicula', 'safra', 'tamanho')
+
+
+def condicoes_filtros(filtros):
+    # Condição de cada filtro ativo da barra lateral (ver WineFilterSerializer), fora a busca: {'pais': Q(...), ...,
+    # 'preco': Q(...)}; preco_max é exclusivo, como nas faixas
+    condicoes = {}
+    for campo in FILTROS_MULTIPLOS:
+        if filtros.get(campo):
+            condicoes[campo] = Q(**{f'{campo}__in': filtros[campo]})
+    preco = Q()
+    if filtros.get('preco_min') is not None:
+        preco &= Q(preco_venda__gte=filtros['preco_min'])
+    if filtros.get('preco_max') is not None:
+        preco &= Q(preco_venda__lt=filtros['preco_max'])
+    if preco:
+        condicoes['preco'] = preco
+    return condicoes
+
+
+def filtrar_vinhos(queryset, filtros):
+    return queryset.filter(*condicoes_filtros(filtros).values())
+
+
+def _consulta(q):
+    return SearchQuery(q, search_type='websearch', config='simple')
+
+
+def filtro_busca(q):
+    # Termos no documento "busca" ou, com termos mais longos, nome/vinícula parecidos (pg_trgm)
+    filtro = Q(busca=_consulta(q))
+    if len(q) >= MIN_TERMO_APROXIMADO:
+        filtro |= Q(nome__trigram_word_similar=q) | Q(vinicula__trigram_word_similar=q)
+    return filtro
+
+
+def buscar_vinhos(queryset, q):
+    """
+    Filtra ``queryset`` pelos vinhos que casam com ``q`` e ordena pela
+    relevância. Casam os vinhos cujo documento ``busca`` (nome, vinícula, uva e
+    país) contém os termos de ``q``, na sintaxe de buscador ("frase exata",
+    or, -termo), e, para tolerar erros de digitação, os de nome ou vinícula
+    parecidos com ``q`` (pg_trgm). Os dois filtros são resolvidos nos índices
+    GIN, e a relevância só é calculada para as linhas encontradas.
+    """
+    relevancia = SearchRank(F('busca'), _consulta(q))
+    if len(q) >= MIN_TERMO_APROXIMADO:
+        relevancia += Greatest(TrigramWordSimilarity(q, 'nome'), TrigramWordSimilarity(q, 'vinicula'))
+    # ts_rank devolve real; em double precision o valor volta do cursor de paginação sem perder casas
+    return (queryset.filter(filtro_busca(q)).annotate(relevancia=Cast(relevancia, FloatField()))
+            .order_by('-relevancia', '-created_at', '-id'))
@@ -0,0 +1,26 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from suppliers.models import Supplier
+from wines.cache import invalidate_inventory
+from wines.models import MarkupRule, MovimentoEstoque, Wine
+from wines.pricing import invalidate_markup_index
+
+
+@receiver([post_save, post_delete], sender=Wine)
+@receiver([post_save, post_delete], sender=Supplier)
+@receiver([post_save, post_delete], sender=MarkupRule)
+@receiver([post_save, post_delete], sender=MovimentoEstoque)
+def inventory_changed(sender, instance, **kwargs):
+    invalidate_inventory(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=MarkupRule)
+def markup_rules_changed(sender, instance, **kwargs):
+    invalidate_markup_index(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Wine.fornecedores.through)
+def wine_suppliers_changed(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_inventory(instance.user_id)
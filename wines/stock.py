@@ -0,0 +1,222 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Now, TruncDate
+from django.utils import timezone
+
+from users.models import CustomUser
+from wines.cache import invalidate_inventory
+from wines.models import EstoqueDiario, MovimentoEstoque, Wine
+
+# Limite de movimentos por requisição do endpoint em lote
+MAX_MOVIMENTOS_LOTE = 5000
+# Maior intervalo aceito pelo histórico de estoque
+MAX_DIAS_HISTORICO = 731
+
+
+# Delta de um movimento em SQL: + para entrada, - para saída
+DELTA = Case(When(tipo=MovimentoEstoque.ENTRADA, then=F('quantidade')), default=-F('quantidade'),
+             output_field=IntegerField())
+
+
+class EstoqueInsuficiente(Exception):
+    pass
+
+
+def delta(tipo, quantidade):
+    return quantidade if tipo == MovimentoEstoque.ENTRADA else -quantidade
+
+
+def aplicar_delta(vinho_id, valor):
+    """
+    Soma ``valor`` ao estoque do vinho direto no banco (``F()``, sem ler o
+    estoque antes). Uma saída só é aplicada se houver estoque suficiente:
+    retorna 0 quando o UPDATE condicional não encontra a linha.
+    """
+    vinhos = Wine.objects.filter(pk=vinho_id)
+    if valor < 0:
+        vinhos = vinhos.filter(estoque__gte=-valor)
+    return vinhos.update(estoque=F('estoque') + valor, updated_at=Now())
+
+
+def registrar_movimento(movimento):
+    # Grava o movimento e atualiza o estoque na mesma transação; o lock da linha do vinho só dura até o commit
+    with transaction.atomic():
+        movimento.save()
+        if not aplicar_delta(movimento.vinho_id, delta(movimento.tipo, movimento.quantidade)):
+            raise EstoqueInsuficiente(f"Estoque insuficiente para a saída de {movimento.quantidade} unidade(s).")
+        invalidate_inventory(movimento.user_id)
+    return movimento
+
+
+def registrar_movimentos(user, itens):
+    """
+    Grava um lote de movimentos (dicts com ``vinho``, ``tipo`` e
+    ``quantidade``, na ordem em que aconteceram) numa transação. Retorna, para
+    cada item, o ``MovimentoEstoque`` criado ou a mensagem de erro.
+
+    Os vinhos do lote são lidos e travados numa única consulta; as saídas sem
+    estoque são recusadas item a item, os movimentos aceitos entram com um
+    ``bulk_create`` e os deltas somados por vinho são aplicados num único
+    UPDATE com CASE.
+    """
+    with transaction.atomic():
+        # Ordem fixa de lock entre lotes concorrentes, para não haver deadlock
+        saldos = dict(
+            Wine.objects.select_for_update()
+            .filter(user=user, pk__in={item['vinho'] for item in itens})
+            .order_by('pk')
+            .values_list('pk', 'estoque')
+        )
+
+        resultados = []
+        deltas = {}
+        for item in itens:
+            vinho_id = item['vinho']
+            if vinho_id not in saldos:
+                resultados.append("Wine not found.")
+                continue
+            valor = delta(item['tipo'], item['quantidade'])
+            if saldos[vinho_id] + valor < 0:
+                resultados.append("Insufficient stock for this movement.")
+                continue
+            saldos[vinho_id] += valor
+            deltas[vinho_id] = deltas.get(vinho_id, 0) + valor
+            resultados.append(MovimentoEstoque(vinho_id=vinho_id, user=user, tipo=item['tipo'],
+                                               quantidade=item['quantidade']))
+
+        MovimentoEstoque.objects.bulk_create([r for r in resultados if isinstance(r, MovimentoEstoque)])
+        deltas = {vinho_id: valor for vinho_id, valor in deltas.items() if valor}
+        if deltas:
+            Wine.objects.filter(pk__in=deltas).update(
+                estoque=F('estoque') + Case(*[When(pk=vinho_id, then=Value(valor)) for vinho_id, valor in deltas.items()],
+                                            output_field=IntegerField()),
+                updated_at=Now(),
+            )
+            invalidate_inventory(user.pk)
+    return resultados
+
+
+def _fim_do_dia(data):
+    # Primeiro instante do dia seguinte, no fuso atual
+    return timezone.make_aware(datetime.combine(data + timedelta(days=1), time.min))
+
+
+def consolidar_dia(data):
+    """
+    Grava (ou regrava) o fechamento de ``data`` de todos os vinhos que tiveram
+    movimento nesse dia: o estoque atual menos os movimentos posteriores ao
+    fim do dia. Uma consulta agregada e um upsert em lote; pode ser repetida.
+    """
+    inicio, fim = _fim_do_dia(data - timedelta(days=1)), _fim_do_dia(data)
+    no_dia = Q(data_movimento__lt=fim)
+    linhas = (
+        MovimentoEstoque.objects.filter(data_movimento__gte=inicio)
+        .values('vinho', 'vinho__estoque')
+        .annotate(
+            entradas=Sum('quantidade', filter=no_dia & Q(tipo=MovimentoEstoque.ENTRADA), default=0),
+            saidas=Sum('quantidade', filter=no_dia & Q(tipo=MovimentoEstoque.SAIDA), default=0),
+            posterior=Sum(DELTA, filter=~no_dia, default=0),
+        )
+        .filter(Q(entradas__gt=0) | Q(saidas__gt=0))
+    )
+    fechamentos = [
+        EstoqueDiario(vinho_id=linha['vinho'], data=data, estoque=linha['vinho__estoque'] - linha['posterior'],
+                      entradas=linha['entradas'], saidas=linha['saidas'])
+        for linha in linhas
+    ]
+    EstoqueDiario.objects.bulk_create(fechamentos, batch_size=1000, update_conflicts=True,
+                                      unique_fields=['vinho', 'data'],
+                                      update_fields=['estoque', 'entradas', 'saidas'])
+    return len(fechamentos)
+
+
+def serie_estoque(vinho, inicio, fim):
+    """
+    Estoque de ``vinho`` no fim de cada dia de ``inicio`` a ``fim``. Lê os
+    fechamentos do período, o último fechamento anterior a ele e só os
+    movimentos ainda não consolidados (depois do último fechamento).
+    """
+    inicio = max(inicio, timezone.localdate(vinho.created_at))
+    if inicio > fim:
+        return []
+
+    fechamentos = {
+        fechamento.data: fechamento.estoque
+        for fechamento in EstoqueDiario.objects.filter(vinho=vinho, data__range=(inicio, fim))
+    }
+    anterior = EstoqueDiario.objects.filter(vinho=vinho, data__lt=inicio).order_by('-data').first()
+
+    # Movimentos ainda não consolidados, somados por dia
+    if anterior is not None:
+        ultimo = max(fechamentos, default=anterior.data)
+        pendentes = MovimentoEstoque.objects.filter(vinho=vinho, data_movimento__gte=_fim_do_dia(ultimo),
+                                                    data_movimento__lt=_fim_do_dia(fim))
+    else:
+        # Sem fechamento antes do período: parte do estoque atual e desfaz os movimentos a partir de inicio
+        pendentes = MovimentoEstoque.objects.filter(vinho=vinho,
+                                                    data_movimento__gte=_fim_do_dia(inicio - timedelta(days=1)))
+    deltas = dict(
+        pendentes.annotate(dia=TruncDate('data_movimento')).values('dia')
+        .annotate(total=Sum(DELTA)).values_list('dia', 'total')
+    )
+    if anterior is not None:
+        # Movimentos pendentes entre o último fechamento e o início do período
+        saldo = anterior.estoque + sum(total for dia, total in deltas.items() if dia < inicio)
+    else:
+        saldo = vinho.estoque - sum(deltas.values())
+
+    serie = []
+    dia = inicio
+    while dia <= fim:
+        if dia in fechamentos:
+            saldo = fechamentos[dia]
+        else:
+            saldo += deltas.get(dia, 0)
+        serie.append({'data': dia, 'estoque': saldo})
+        dia += timedelta(days=1)
+    return serie
+
+
+def filtro_estoque_baixo(estoque_minimo_padrao):
+    # Vinhos no ou abaixo do próprio mínimo ou, sem mínimo próprio, do padrão do usuário (servido pelos índices parciais)
+    filtro = Q(estoque__lte=F('estoque_minimo'))
+    if estoque_minimo_padrao is not None:
+        filtro |= Q(estoque_minimo__isnull=True, estoque__lte=estoque_minimo_padrao)
+    return filtro
+
+
+def vinhos_estoque_baixo(user):
+    return Wine.objects.filter(filtro_estoque_baixo(user.estoque_minimo_padrao), user=user)
+
+
+def usuarios_com_estoque_baixo():
+    return CustomUser.objects.filter(
+        Exists(Wine.objects.filter(filtro_estoque_baixo(OuterRef('estoque_minimo_padrao')), user=OuterRef('pk')))
+    )
+
+
+def alertas_estoque_baixo(user):
+    """
+    Vinhos do usuário com estoque baixo agrupados por fornecedor, para um
+    pedido de reposição por fornecedor. Um vinho com vários fornecedores
+    aparece em cada um deles; os sem fornecedor ficam num grupo com
+    ``fornecedor`` nulo, no fim.
+    """
+    linhas = (
+        vinhos_estoque_baixo(user)
+        .annotate(limite=Coalesce('estoque_minimo', Value(user.estoque_minimo_padrao), output_field=IntegerField()))
+        .order_by('fornecedores__nome', 'nome', 'safra')
+        .values_list('id', 'nome', 'safra', 'tamanho', 'estoque', 'limite',
+                     'fornecedores__id', 'fornecedores__nome', 'fornecedores__email')
+    )
+    grupos = {}
+    for vinho_id, nome, safra, tamanho, estoque, limite, fornecedor_id, fornecedor, email in linhas:
+        grupo = grupos.setdefault(fornecedor_id, {
+            'fornecedor': {'id': fornecedor_id, 'nome': fornecedor, 'email': email} if fornecedor_id else None,
+            'vinhos': [],
+        })
+        grupo['vinhos'].append({'id': vinho_id, 'nome': nome, 'safra': safra, 'tamanho': tamanho,
+                                'estoque': estoque, 'estoque_minimo': limite})
+    return list(grupos.values())
@@ -0,0 +1,102 @@
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from wines.importers import WineImporter
+from wines.models import ImportJob
+from wines.readers import iter_row_batches
+from wines.stock import alertas_estoque_baixo, consolidar_dia, usuarios_com_estoque_baixo
+
+logger = logging.getLogger(__name__)
+
+
+def _apagar_arquivo(job):
+    # O arquivo só serve para (re)processar a importação; o caminho vazio marca que ele não existe mais
+    job.arquivo.delete(save=False)
+    ImportJob.objects.filter(pk=job.pk).update(arquivo='')
+
+
+@shared_task
+def processar_importacao(job_id):
+    job = ImportJob.objects.select_related('user').get(pk=job_id)
+    jobs = ImportJob.objects.filter(pk=job.pk)
+    jobs.update(status=ImportJob.RUNNING, mensagem='', updated_at=timezone.now())
+
+    # Numa nova tentativa, os contadores continuam de onde a anterior parou
+    importer = WineImporter(job.user, upsert=job.upsert)
+    importer.criados, importer.atualizados, importer.ignorados = (job.linhas_importadas, job.linhas_atualizadas,
+                                                                  job.linhas_ignoradas)
+    importer.erros, importer.total_erros = list(job.erros), job.linhas_com_erro
+    processadas, lidas = job.linhas_processadas, 0
+    try:
+        with job.arquivo.open('rb') as arquivo:
+            for lote in iter_row_batches(arquivo):
+                # Linhas já gravadas por uma tentativa anterior são puladas
+                pular, lidas = max(0, job.linhas_processadas - lidas), lidas + len(lote)
+                lote = lote[pular:]
+                if not lote:
+                    continue
+                # O lote e o progresso são gravados juntos: linhas_processadas é sempre o que já está no banco
+                with transaction.atomic():
+                    importer.import_rows(lote)
+                    processadas += len(lote)
+                    jobs.update(linhas_processadas=processadas, linhas_importadas=importer.criados,
+                                linhas_atualizadas=importer.atualizados, linhas_ignoradas=importer.ignorados,
+                                linhas_com_erro=importer.total_erros, erros=importer.erros,
+                                updated_at=timezone.now())
+    except FileNotFoundError as exc:
+        logger.error(f"Import job {job_id} failed: {exc}")
+        mensagem = "Uploaded file not found: the worker must share MEDIA_ROOT with the web process."
+    except ValueError as exc:
+        logger.error(f"Import job {job_id} failed: {exc}")
+        mensagem = str(exc)
+    except Exception as exc:
+        logger.exception(f"Import job {job_id} failed")
+        mensagem = str(exc)
+    else:
+        jobs.update(status=ImportJob.DONE, updated_at=timezone.now(), finished_at=timezone.now())
+        _apagar_arquivo(job)
+        logger.debug(f"Import job {job_id} done: {processadas} rows, {importer.criados} created, "
+                     f"{importer.atualizados} updated, {importer.ignorados} unchanged")
+        return
+
+    # Os lotes já gravados ficam; POST import_jobs/<id>/retry/ retoma a partir de linhas_processadas
+    jobs.update(status=ImportJob.FAILED, mensagem=mensagem, updated_at=timezone.now(), finished_at=timezone.now())
+
+
+@shared_task
+def limpar_importacoes():
+    # Arquivos de importações que falharam e não foram retomadas dentro do prazo
+    limite = timezone.now() - timedelta(days=settings.IMPORT_RETENCAO_DIAS)
+    antigas = ImportJob.objects.filter(status=ImportJob.FAILED, finished_at__lt=limite).exclude(arquivo='')
+    for job in antigas:
+        _apagar_arquivo(job)
+
+
+@shared_task
+def consolidar_estoque_diario(dias=1):
+    # Fecha os últimos `dias` dias até ontem; rodar de novo só regrava os mesmos fechamentos
+    hoje = timezone.localdate()
+    for atraso in range(dias, 0, -1):
+        data = hoje - timedelta(days=atraso)
+        logger.info("Estoque diário de %s: %d vinho(s)", data, consolidar_dia(data))
+
+
+@shared_task
+def alertar_estoque_baixo():
+    # Um e-mail por usuário com os vinhos a repor agrupados por fornecedor
+    for user in usuarios_com_estoque_baixo().exclude(email=''):
+        grupos = alertas_estoque_baixo(user)
+        corpo = render_to_string('estoque_baixo_email.html', {'user': user, 'grupos': grupos})
+        mensagem = EmailMultiAlternatives('Low stock alert', corpo, settings.EMAIL_HOST_USER, [user.email])
+        mensagem.attach_alternative(corpo, "text/html")
+        try:
+            mensagem.send()
+        except Exception:
+            logger.exception("Falha ao enviar o alerta de estoque baixo para %s", user.email)
@@ -1,3 +1,1148 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from functools import partial
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import pyarrow.parquet as pq
+from openpyxl import Workbook, load_workbook
+from rest_framework.test import APITestCase
+
+from suppliers.models import Supplier
+from users.models import CustomUser
+from wines.api.renderers import XLSXRenderer
+from wines.benchmark import COLUNAS, compare, synthetic_rows
+from wines.exporters import EXPORT_COLUMNS, PARQUET_SCHEMA
+from wines.facets import _contagens
+from wines.importers import WineImporter
+from wines.bulk import MAX_VINHOS_LOTE
+from wines.cache import bump_generation
+from wines.models import EstoqueDiario, ImportJob, MarkupRule, MovimentoEstoque, Wine
+from wines.pricing import MARKUP_RULES, MarkupIndex, get_markup_index, reprice_wines
+from wines.readers import iter_row_batches
+from wines.stock import MAX_DIAS_HISTORICO, MAX_MOVIMENTOS_LOTE, consolidar_dia
+from wines.tasks import alertar_estoque_baixo, limpar_importacoes
+from wines.validation import MAX_LENGTH_FORNECEDOR
+
+VINHOS = '/api/v1/wines/wines/'
+REGRAS = '/api/v1/wines/markup_rules/'
+IMPORTAR = '/api/v1/wines/import/'
+EXPORTAR = '/api/v1/wines/export/'
+JOBS = '/api/v1/wines/import_jobs/'
+MOVIMENTOS = '/api/v1/wines/movimentos/'
+
+
+class BaseTestCase(APITestCase):
+    def setUp(self):
+        # Gerações, índices de markup e respostas ficam no cache entre um teste e outro
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='sommelier', password='x')
+        self.client.force_authenticate(self.user)
+
+    def criar_vinho(self, nome='Reserva', **campos):
+        dados = {'user': self.user, 'nome': nome, 'vinicula': 'Vinícola', 'pais': 'Chile', 'uva': 'Carmenere',
+                 'safra': '2020', 'tamanho': Wine.INTEIRA, 'valor_custo': Decimal('50.00'), **campos}
+        return Wine.objects.create(**dados)
+
+    def escrever(self, metodo, url, dados, **extra):
+        # A geração do inventário só muda no commit da escrita
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, metodo)(url, dados, format=extra.pop('format', 'json'), **extra)
+
+    def diretorio_temporario(self, setting):
+        # Arquivos gerados pelo teste (uploads, exportações) vão para um diretório descartável
+        diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, diretorio)
+        configuracao = override_settings(**{setting: diretorio})
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        return diretorio
+
+
+def linha_planilha(**campos):
+    return {'Nome': 'Reserva', 'Vinícola': 'Vinícola', 'País': 'Chile', 'Uva': 'Carmenere', 'Safra': '2020',
+            'Tamanho': 'inteira', 'Valor de Custo': '40.42', 'Markup': '50', 'Estoque': '12',
+            'Fornecedores': 'Importadora A, Importadora B', **campos}
+
+
+def importar(user, *linhas, upsert=False):
+    importer = WineImporter(user, upsert=upsert)
+    importer.import_rows([(numero, linha) for numero, linha in enumerate(linhas, start=2)])
+    return importer
+
+
+def planilha_csv(texto, nome='vinhos.csv'):
+    return SimpleUploadedFile(nome, texto.encode('utf-8-sig'), content_type='text/csv')
+
+
+def planilha_xlsx(*linhas, nome='vinhos.xlsx'):
+    workbook = Workbook()
+    for linha in linhas:
+        workbook.active.append(linha)
+    conteudo = io.BytesIO()
+    workbook.save(conteudo)
+    return SimpleUploadedFile(nome, conteudo.getvalue())
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_planilha_sintetica(self):
+        linhas = list(synthetic_rows(500))
+        self.assertEqual(len(linhas), 500)
+        self.assertTrue(all(len(linha) == len(COLUNAS) for linha in linhas))
+        # Mesma semente, mesma planilha: as execuções são comparáveis com o baseline
+        self.assertEqual(linhas, list(synthetic_rows(500)))
+
+        fornecedores = [linha[COLUNAS.index('Fornecedores')].split(', ') for linha in linhas]
+        self.assertTrue(all(1 <= len(nomes) <= 3 for nomes in fornecedores))
+        # Zipf: o fornecedor mais frequente aparece bem mais que a média
+        contagem = {}
+        for nome in (nome for nomes in fornecedores for nome in nomes):
+            contagem[nome] = contagem.get(nome, 0) + 1
+        self.assertGreater(max(contagem.values()), 3 * sum(contagem.values()) / len(contagem))
+
+    def test_compara_com_baseline(self):
+        baseline = {'1000': {'importacao': {'tempo_s': 1.0, 'memoria_pico_mb': 10.0, 'queries': 20}}}
+        dentro = {'1000': {'importacao': {'tempo_s': 1.15, 'memoria_pico_mb': 10.0, 'queries': 20}}}
+        self.assertEqual(compare(dentro, baseline, 0.2), [])
+
+        pior = {'1000': {'importacao': {'tempo_s': 1.3, 'memoria_pico_mb': 10.0, 'queries': 21}},
+                '10000': {'importacao': {'tempo_s': 9.0, 'memoria_pico_mb': 50.0, 'queries': 20}}}
+        self.assertEqual(compare(pior, baseline, 0.2), [
+            ('1000', 'importacao', 'tempo_s', 1.0, 1.3),
+            ('1000', 'importacao', 'queries', 20, 21),
+        ])
+
+
+class ImportacaoTests(BaseTestCase):
+    def test_cria_vinhos_e_fornecedores(self):
+        existente = Supplier.objects.create(user=self.user, nome='Importadora A')
+        importer = importar(self.user, linha_planilha(),
+                            linha_planilha(Nome='Gran Reserva', Fornecedores='Importadora B'))
+        self.assertEqual(importer.criados, 2)
+
+        # O fornecedor que já existia é reaproveitado; o novo é criado uma vez só
+        self.assertEqual(sorted(Supplier.objects.filter(user=self.user).values_list('nome', flat=True)),
+                         ['Importadora A', 'Importadora B'])
+        reserva = Wine.objects.get(user=self.user, nome='Reserva')
+        self.assertIn(existente, reserva.fornecedores.all())
+        self.assertEqual(reserva.fornecedores.count(), 2)
+        self.assertEqual((reserva.estoque, reserva.preco_venda), (12, Decimal('60.63')))
+
+    def test_preco_pela_faixa_de_markup(self):
+        MarkupRule.objects.create(user=self.user, min_price=0, max_price=100, percentage=100)
+        importar(self.user, linha_planilha())
+        vinho = Wine.objects.get(user=self.user)
+        self.assertEqual((vinho.markup, vinho.preco_venda), (Decimal('100.00'), Decimal('80.84')))
+
+    def test_consultas_nao_crescem_com_o_lote(self):
+        def consultas(total, prefixo):
+            linhas = [linha_planilha(Nome=f'{prefixo} {i}', Fornecedores=f'{prefixo} A, {prefixo} {i % 3}')
+                      for i in range(total)]
+            # Fornecedores e regras de markup são carregados uma vez, na criação do importador
+            importer = WineImporter(self.user)
+            with CaptureQueriesContext(connection) as queries:
+                importer.import_rows(list(enumerate(linhas, start=2)))
+            return len(queries.captured_queries)
+
+        self.assertEqual(consultas(5, 'Pequeno'), consultas(50, 'Grande'))
+        self.assertEqual(Wine.objects.filter(user=self.user).count(), 55)
+
+
+class LeitorTests(SimpleTestCase):
+    def test_csv_em_lotes(self):
+        texto = 'Nome;Safra\n' + ''.join(f'Vinho {i};2020\n' for i in range(5)) + ';\nÚltimo;2021\n'
+        lotes = list(iter_row_batches(planilha_csv(texto), batch_size=2))
+        self.assertEqual([len(lote) for lote in lotes], [2, 2, 2])
+        # Delimitador detectado, BOM removido e linha em branco pulada sem mudar a numeração
+        self.assertEqual(lotes[0][0], (2, {'Nome': 'Vinho 0', 'Safra': '2020'}))
+        self.assertEqual(lotes[-1][-1], (8, {'Nome': 'Último', 'Safra': '2021'}))
+
+    def test_xlsx(self):
+        arquivo = planilha_xlsx(['Nome', 'Safra'], ['Reserva', 2019], [None, None], ['Gran Reserva', 2020])
+        linhas = [linha for lote in iter_row_batches(arquivo) for linha in lote]
+        self.assertEqual(linhas, [(2, {'Nome': 'Reserva', 'Safra': 2019}),
+                                  (4, {'Nome': 'Gran Reserva', 'Safra': 2020})])
+
+    def test_arquivo_invalido(self):
+        with self.assertRaises(ValueError):
+            list(iter_row_batches(SimpleUploadedFile('vinhos.xlsx', b'isto nao e uma planilha')))
+
+
+class ImportJobTests(BaseTestCase):
+    CABECALHO = ','.join(COLUNAS) + '\n'
+
+    def setUp(self):
+        super().setUp()
+        self.diretorio_temporario('MEDIA_ROOT')
+
+    def planilha(self, total):
+        linha = 'Vinho {},Vinícola,Chile,Carmenere,2020,inteira,Importadora,10,50,1\n'
+        return planilha_csv(self.CABECALHO + ''.join(linha.format(i) for i in range(total)))
+
+    def importar(self, arquivo, **dados):
+        # Com o broker em memória as tarefas rodam no próprio processo, depois do commit
+        return self.escrever('post', IMPORTAR, {'file': arquivo, **dados}, format='multipart')
+
+    def test_importacao_em_segundo_plano(self):
+        response = self.importar(self.planilha(3))
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(response['Location'].endswith(f"{JOBS}{response.data['id']}/"))
+
+        job = self.client.get(response['Location']).data
+        self.assertEqual((job['status'], job['linhas_processadas'], job['linhas_importadas']), ('done', 3, 3))
+        # O arquivo enviado não fica no disco depois de importado
+        self.assertFalse(ImportJob.objects.get(pk=job['id']).arquivo)
+        self.assertEqual(Wine.objects.filter(user=self.user).count(), 3)
+
+    def test_jobs_de_outro_usuario(self):
+        alheio = CustomUser.objects.create_user(username='outro', password='x')
+        job = ImportJob.objects.create(user=alheio, arquivo=self.planilha(1))
+        self.assertEqual(self.client.get(JOBS).data, [])
+        self.assertEqual(self.client.get(f'{JOBS}{job.pk}/').status_code, 404)
+
+    @mock.patch('wines.tasks.iter_row_batches', partial(iter_row_batches, batch_size=2))
+    def test_retomada_depois_de_uma_falha(self):
+        import_rows = WineImporter.import_rows
+
+        def falha_no_segundo_lote(importer, rows):
+            if rows[0][0] == 4:
+                raise RuntimeError("conexão perdida")
+            return import_rows(importer, rows)
+
+        with mock.patch.object(WineImporter, 'import_rows', falha_no_segundo_lote), self.assertLogs('wines.tasks'):
+            job_id = self.importar(self.planilha(5)).data['id']
+        job = ImportJob.objects.get(pk=job_id)
+        # O primeiro lote ficou gravado, e o progresso diz exatamente até onde
+        self.assertEqual((job.status, job.linhas_processadas, job.mensagem), (ImportJob.FAILED, 2, "conexão perdida"))
+        self.assertEqual(Wine.objects.filter(user=self.user).count(), 2)
+        self.assertTrue(job.arquivo)
+
+        response = self.escrever('post', f'{JOBS}{job_id}/retry/', {})
+        self.assertEqual(response.status_code, 202)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.linhas_processadas, job.linhas_importadas), (ImportJob.DONE, 5, 5))
+        # Sem upsert e sem duplicar as linhas da primeira tentativa
+        self.assertEqual(sorted(Wine.objects.filter(user=self.user).values_list('nome', flat=True)),
+                         [f'Vinho {i}' for i in range(5)])
+
+        self.assertEqual(self.escrever('post', f'{JOBS}{job_id}/retry/', {}).status_code, 400)
+
+    def test_arquivos_de_falhas_antigas_sao_apagados(self):
+        antiga = ImportJob.objects.create(user=self.user, arquivo=self.planilha(1), status=ImportJob.FAILED,
+                                          finished_at=timezone.now() - timedelta(days=30))
+        recente = ImportJob.objects.create(user=self.user, arquivo=self.planilha(1), status=ImportJob.FAILED,
+                                           finished_at=timezone.now())
+        caminho = antiga.arquivo.path
+        limpar_importacoes()
+        antiga.refresh_from_db()
+        recente.refresh_from_db()
+        self.assertFalse(antiga.arquivo)
+        self.assertFalse(os.path.exists(caminho))
+        self.assertTrue(recente.arquivo)
+        # Sem o arquivo não há como retomar
+        self.assertEqual(self.escrever('post', f'{JOBS}{antiga.pk}/retry/', {}).status_code, 400)
+
+
+class ExportacaoTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.diretorio_temporario('EXPORT_CACHE_DIR')
+        importadora = Supplier.objects.create(user=self.user, nome='Importadora')
+        distribuidora = Supplier.objects.create(user=self.user, nome='Distribuidora')
+        self.criar_vinho('Reserva', estoque=4).fornecedores.set([importadora, distribuidora])
+        self.criar_vinho('Gran Reserva', tamanho=Wine.MEIA).fornecedores.set([importadora])
+
+    def exportar(self, formato=None, **headers):
+        response = self.client.get(EXPORTAR + (f'?format={formato}' if formato else ''), **headers)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_xlsx(self):
+        response, conteudo = self.exportar()
+        self.assertEqual(response['Content-Type'], XLSXRenderer.media_type)
+        linhas = list(load_workbook(io.BytesIO(conteudo)).active.iter_rows(values_only=True))
+        self.assertEqual(list(linhas[0]), EXPORT_COLUMNS)
+        self.assertEqual(linhas[1][:7], ('Gran Reserva', 'Vinícola', 'Chile', 'Carmenere', '2020', 'Meia Garrafa',
+                                         'Importadora'))
+        self.assertEqual(linhas[2][6], 'Distribuidora, Importadora')
+
+    def test_consultas_nao_crescem_com_os_vinhos(self):
+        def consultas():
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.exportar('csv')
+            return len(queries.captured_queries)
+
+        antes = consultas()
+        for i in range(20):
+            self.criar_vinho(f'Vinho {i}').fornecedores.set(Supplier.objects.filter(user=self.user))
+        self.assertEqual(consultas(), antes)
+
+    def test_vinhos_de_outro_usuario_ficam_de_fora(self):
+        alheio = CustomUser.objects.create_user(username='outro', password='x')
+        self.criar_vinho('Alheio', user=alheio)
+        _, conteudo = self.exportar('csv')
+        self.assertNotIn('Alheio', conteudo.decode())
+
+    def test_csv(self):
+        response, conteudo = self.exportar('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        linhas = list(csv.reader(io.StringIO(conteudo.decode('utf-8-sig'))))
+        self.assertEqual(linhas[0], EXPORT_COLUMNS)
+        self.assertEqual(linhas[2], ['Reserva', 'Vinícola', 'Chile', 'Carmenere', '2020', 'Garrafa Inteira',
+                                     'Distribuidora, Importadora', '50.00', '0.00', '50.00', '4'])
+
+    def test_ndjson(self):
+        _, conteudo = self.exportar('ndjson')
+        linhas = [json.loads(linha) for linha in conteudo.decode().splitlines()]
+        self.assertEqual([linha['nome'] for linha in linhas], ['Gran Reserva', 'Reserva'])
+        self.assertEqual((linhas[1]['valor_custo'], linhas[1]['estoque']), ('50.00', 4))
+
+    def test_parquet(self):
+        _, conteudo = self.exportar('parquet')
+        tabela = pq.read_table(io.BytesIO(conteudo))
+        self.assertEqual(tabela.schema, PARQUET_SCHEMA)
+        self.assertEqual(tabela.column('preco_venda').to_pylist(), [Decimal('50.00'), Decimal('50.00')])
+        self.assertEqual(tabela.column('estoque').to_pylist(), [0, 4])
+
+    def test_formato_desconhecido(self):
+        response = self.client.get(EXPORTAR + '?format=pdf')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_etag_e_304(self):
+        response, _ = self.exportar('csv')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        nao_modificado = self.client.get(EXPORTAR + '?format=csv', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(nao_modificado.status_code, 304)
+        # Cada formato tem o seu ETag
+        self.assertEqual(self.client.get(EXPORTAR, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_arquivo_guardado_por_versao_do_inventario(self):
+        _, primeiro = self.exportar('parquet')
+        with CaptureQueriesContext(connection) as queries:
+            _, segundo = self.exportar('parquet')
+        # Servido do cache: só o agregado da versão, sem a consulta das linhas
+        self.assertEqual(segundo, primeiro)
+        self.assertFalse(any('STRING_AGG' in query['sql'] for query in queries.captured_queries))
+
+    def test_escrita_gera_nova_versao(self):
+        antes, _ = self.exportar('csv')
+        self.escrever('patch', f"{VINHOS}{Wine.objects.get(nome='Reserva').pk}/", {'uva': 'Syrah'})
+        depois, conteudo = self.exportar('csv', HTTP_IF_NONE_MATCH=antes['ETag'])
+        self.assertNotEqual(depois['ETag'], antes['ETag'])
+        self.assertIn('Syrah', conteudo.decode())
+        # Só a versão atual fica no disco
+        diretorio = os.path.join(settings.EXPORT_CACHE_DIR, str(self.user.pk))
+        self.assertEqual(len(os.listdir(diretorio)), 1)
+
+
+class UpsertTests(BaseTestCase):
+    def importar(self, *linhas):
+        return importar(self.user, *linhas, upsert=True)
+
+    def test_linha_igual_e_ignorada(self):
+        self.importar(linha_planilha())
+        importer = self.importar(linha_planilha())
+        self.assertEqual((importer.criados, importer.atualizados, importer.ignorados), (0, 0, 1))
+        self.assertEqual(Wine.objects.filter(user=self.user).count(), 1)
+
+    def test_hash_independe_do_formato_da_celula(self):
+        # Mesma linha lida de um xlsx: float com ruído, espaços extras e fornecedores em outra ordem
+        self.importar(linha_planilha())
+        xlsx = linha_planilha(**{'Valor de Custo': '40.419999999999995', 'Nome': ' Reserva ', 'Markup': '50.0',
+                                 'Fornecedores': 'Importadora B,Importadora A'})
+        self.assertEqual(self.importar(xlsx).ignorados, 1)
+
+    def test_linha_alterada_e_regravada(self):
+        self.importar(linha_planilha())
+        importer = self.importar(linha_planilha(**{'Valor de Custo': '60', 'Fornecedores': 'Importadora C'}))
+        self.assertEqual(importer.atualizados, 1)
+        vinho = Wine.objects.get(user=self.user)
+        self.assertEqual((vinho.valor_custo, vinho.preco_venda), (Decimal('60.00'), Decimal('90.00')))
+        self.assertEqual(list(vinho.fornecedores.values_list('nome', flat=True)), ['Importadora C'])
+
+    def test_repetida_na_planilha_vale_a_ultima(self):
+        importer = self.importar(linha_planilha(Uva='Merlot'), linha_planilha(Uva='Syrah'))
+        self.assertEqual(importer.criados, 1)
+        self.assertEqual(Wine.objects.get(user=self.user).uva, 'Syrah')
+
+    def test_vinhos_repetidos_no_banco_atualizam_o_mais_recente(self):
+        antigo = self.criar_vinho()
+        recente = self.criar_vinho()
+        Wine.objects.filter(pk=antigo.pk).update(created_at=recente.created_at - timedelta(days=1))
+        self.importar(linha_planilha(Uva='Syrah'))
+        antigo.refresh_from_db()
+        recente.refresh_from_db()
+        self.assertEqual((antigo.uva, recente.uva), ('Carmenere', 'Syrah'))
+
+
+class ValidacaoTests(BaseTestCase):
+    CABECALHO = ','.join(COLUNAS) + '\n'
+    VALIDA = 'Reserva,Vinícola,Chile,Carmenere,2019.0,inteira,Importadora,10,50,1\n'
+
+    def setUp(self):
+        super().setUp()
+        self.diretorio_temporario('MEDIA_ROOT')
+
+    def dry_run(self, arquivo):
+        return self.client.post(IMPORTAR, {'file': arquivo, 'dry_run': 'true'}, format='multipart')
+
+    def test_relatorio(self):
+        linhas = [
+            self.VALIDA,
+            ',Vinícola,Chile,Carmenere,20,inteira,Importadora,10,50,1\n',
+            'Outro,Vinícola,Chile,Carmenere,2020,magnum,Importadora,abc,50,-1\n',
+            '\n',
+            f"Longo,Vinícola,Chile,Carmenere,2020,inteira,\"Importadora,{'x' * 256}\",10,50,1\n",
+        ]
+        response = self.dry_run(planilha_csv(self.CABECALHO + ''.join(linhas)))
+        self.assertEqual(response.status_code, 200)
+        relatorio = response.data
+        self.assertEqual((relatorio['total_linhas'], relatorio['linhas_validas'], relatorio['linhas_invalidas']),
+                         (4, 1, 3))
+        self.assertEqual(relatorio['erros_por_coluna'], {'Nome': 1, 'Safra': 1, 'Tamanho': 1, 'Valor de Custo': 1,
+                                                         'Estoque': 1, 'Fornecedores': 1})
+        self.assertEqual([erro['linha'] for erro in relatorio['erros']], [3, 4, 6])
+        self.assertEqual(set(relatorio['erros'][1]['erros']), {'Tamanho', 'Valor de Custo', 'Estoque'})
+        self.assertFalse(relatorio['erros_truncados'])
+        # Nada é gravado nem enfileirado
+        self.assertFalse(Wine.objects.filter(user=self.user).exists())
+        self.assertFalse(ImportJob.objects.filter(user=self.user).exists())
+
+    def test_xlsx(self):
+        arquivo = planilha_xlsx(COLUNAS, ['Reserva', 'Vinícola', 'Chile', 'Carmenere', 2019, 'inteira', 'Importadora',
+                                          10.5, 50, 3], ['Outro', None, None, None, 19, None, None, 0, None, None])
+        relatorio = self.dry_run(arquivo).data
+        self.assertEqual((relatorio['linhas_validas'], relatorio['erros_por_coluna']),
+                         (1, {'Safra': 1, 'Valor de Custo': 1}))
+
+    @mock.patch('wines.validation.MAX_ERROS_RELATORIO', 2)
+    def test_relatorio_truncado(self):
+        invalidas = ''.join(f'Vinho {i},Vinícola,Chile,Carmenere,99,inteira,,10,50,1\n' for i in range(5))
+        relatorio = self.dry_run(planilha_csv(self.CABECALHO + invalidas)).data
+        self.assertEqual((relatorio['linhas_invalidas'], len(relatorio['erros'])), (5, 2))
+        self.assertTrue(relatorio['erros_truncados'])
+
+    def test_arquivo_invalido(self):
+        response = self.dry_run(SimpleUploadedFile('vinhos.xlsx', b'isto nao e uma planilha'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_linhas_aprovadas_no_dry_run_sao_importadas(self):
+        # Safra como número do Excel e fornecedor no limite: válidos no dry-run e gravados pela importação
+        linhas = self.VALIDA + f"Longo,Vinícola,Chile,Carmenere,2020,inteira,{'x' * MAX_LENGTH_FORNECEDOR},10,50,1\n"
+        self.assertEqual(self.dry_run(planilha_csv(self.CABECALHO + linhas)).data['linhas_invalidas'], 0)
+
+        job = self.escrever('post', IMPORTAR, {'file': planilha_csv(self.CABECALHO + linhas)}, format='multipart')
+        job = ImportJob.objects.get(pk=job.data['id'])
+        self.assertEqual((job.status, job.linhas_importadas), (ImportJob.DONE, 2))
+        self.assertEqual(Wine.objects.get(user=self.user, nome='Reserva').safra, '2019')
+
+    def test_fornecedor_longo_vira_erro_da_linha(self):
+        linhas = self.VALIDA + f"Longo,Vinícola,Chile,Carmenere,2020,inteira,{'x' * 300},10,50,1\n"
+        job = self.escrever('post', IMPORTAR, {'file': planilha_csv(self.CABECALHO + linhas)}, format='multipart')
+        job = ImportJob.objects.get(pk=job.data['id'])
+        self.assertEqual((job.status, job.linhas_importadas, job.linhas_com_erro), (ImportJob.DONE, 1, 1))
+        self.assertEqual(job.erros[0]['linha'], 3)
+
+    @mock.patch('wines.importers.MAX_ERROS_RELATORIO', 2)
+    def test_erros_do_job_limitados(self):
+        invalidas = ''.join(f'Vinho {i},Vinícola,Chile,Carmenere,99,inteira,,10,50,1\n' for i in range(5))
+        job = self.escrever('post', IMPORTAR, {'file': planilha_csv(self.CABECALHO + invalidas)}, format='multipart')
+        job = self.client.get(f"{JOBS}{job.data['id']}/").data
+        self.assertEqual((job['linhas_com_erro'], len(job['erros'])), (5, 2))
+
+
+class MarkupIndexTests(BaseTestCase):
+    def test_busca_pela_faixa(self):
+        regras = [MarkupRule(pk=1, min_price=Decimal('0'), max_price=Decimal('50'), percentage=Decimal('100')),
+                  MarkupRule(pk=2, min_price=Decimal('50'), max_price=Decimal('100'), percentage=Decimal('60')),
+                  MarkupRule(pk=3, min_price=Decimal('200'), max_price=Decimal('300'), percentage=Decimal('30'))]
+        index = MarkupIndex(reversed(regras))
+        self.assertEqual(index.lookup(Decimal('10')), Decimal('100'))
+        # No limite compartilhado vale a regra mais antiga; os limites são inclusivos
+        self.assertEqual(index.lookup(Decimal('50')), Decimal('100'))
+        self.assertEqual(index.lookup(Decimal('100')), Decimal('60'))
+        self.assertIsNone(index.lookup(Decimal('150')))
+        self.assertIsNone(index.lookup(Decimal('300.01')))
+
+    def test_indice_em_dia_sem_consultas(self):
+        MarkupRule.objects.create(user=self.user, min_price=0, max_price=100, percentage=50)
+        get_markup_index(self.user.pk)
+        with self.assertNumQueries(0):
+            get_markup_index(self.user.pk)
+
+        vinho = self.criar_vinho()
+        with CaptureQueriesContext(connection) as queries:
+            vinho.save()
+        self.assertFalse(any('wines_markuprule' in query['sql'] for query in queries.captured_queries))
+
+    def test_escrita_em_outro_processo(self):
+        regra = MarkupRule.objects.create(user=self.user, min_price=0, max_price=100, percentage=50)
+        self.assertEqual(get_markup_index(self.user.pk).lookup(Decimal('10')), Decimal('50'))
+        # Outro processo grava a regra e incrementa a geração no cache compartilhado
+        MarkupRule.objects.filter(pk=regra.pk).update(percentage=80)
+        bump_generation(MARKUP_RULES, self.user.pk)
+        self.assertEqual(get_markup_index(self.user.pk).lookup(Decimal('10')), Decimal('80'))
+
+    def test_escrita_pela_api(self):
+        self.assertIsNone(get_markup_index(self.user.pk).lookup(Decimal('10')))
+        self.escrever('post', REGRAS, {'min_price': 0, 'max_price': 100, 'percentage': 40})
+        self.assertEqual(get_markup_index(self.user.pk).lookup(Decimal('10')), Decimal('40'))
+
+
+class RepricingTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.barato = self.criar_vinho('Barato', valor_custo=Decimal('20.00'))
+        self.caro = self.criar_vinho('Caro', valor_custo=Decimal('500.00'))
+        alheio = CustomUser.objects.create_user(username='outro', password='x')
+        self.alheio = self.criar_vinho('Alheio', user=alheio, valor_custo=Decimal('20.00'))
+
+    def test_nova_regra_reprecifica_so_os_vinhos_da_faixa(self):
+        response = self.escrever('post', REGRAS, {'min_price': 0, 'max_price': 100, 'percentage': 100})
+        self.assertEqual(response.data['vinhos_atualizados'], 1)
+        for vinho in (self.barato, self.caro, self.alheio):
+            vinho.refresh_from_db()
+        self.assertEqual((self.barato.markup, self.barato.preco_venda), (Decimal('100.00'), Decimal('40.00')))
+        # Fora de todas as faixas mantém o markup, como em Wine.save()
+        self.assertEqual(self.caro.preco_venda, Decimal('500.00'))
+        self.assertEqual(self.alheio.preco_venda, Decimal('20.00'))
+
+    def test_exclusao_e_reprecificacao_manual(self):
+        regra = self.escrever('post', REGRAS, {'min_price': 0, 'max_price': 100, 'percentage': 100}).data
+        # Nada mudou desde a última reprecificação
+        self.assertEqual(self.escrever('post', REGRAS + 'reprice/', {}).data['vinhos_atualizados'], 0)
+        self.escrever('delete', f"{REGRAS}{regra['id']}/", {})
+        self.barato.refresh_from_db()
+        self.assertEqual(self.barato.preco_venda, Decimal('40.00'))
+
+    def test_um_update_para_todos_os_vinhos(self):
+        for i in range(20):
+            self.criar_vinho(f'Vinho {i}', valor_custo=Decimal(10 + i))
+        # Criada direto no ORM: nenhum vinho foi reprecificado ainda
+        MarkupRule.objects.create(user=self.user, min_price=0, max_price=1000, percentage=10)
+        get_markup_index(self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(reprice_wines(self.user.pk), 22)
+        self.assertEqual(len(queries.captured_queries), 1)
+
+
+class SimulacaoTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.criar_vinho('Barato', valor_custo=Decimal('20.00'), markup=Decimal('50.00'), estoque=10)
+        self.criar_vinho('Caro', valor_custo=Decimal('500.00'), markup=Decimal('50.00'), estoque=1)
+
+    def simular(self, regras, **extra):
+        return self.client.post(REGRAS + 'simulate/', {'rules': regras, **extra}, format='json')
+
+    def test_totais_atuais_e_propostos(self):
+        response = self.simular([{'min_price': 0, 'max_price': 100, 'percentage': 100}], bins=4)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['total_vinhos'], response.data['vinhos_alterados']), (2, 1))
+        self.assertEqual(response.data['atual'], {'receita': 1050.0, 'custo': 700.0, 'margem': 350.0,
+                                                  'margem_percentual': 33.33, 'preco_medio': 390.0})
+        # Só o vinho de 20,00 entra na faixa: 40,00 x 10 + 750,00 x 1
+        self.assertEqual(response.data['proposto']['receita'], 1150.0)
+        histograma = response.data['histograma_precos']
+        self.assertEqual(len(histograma['limites']), 5)
+        self.assertEqual((sum(histograma['atual']), sum(histograma['proposto'])), (2, 2))
+
+    def test_nada_e_gravado(self):
+        self.simular([{'min_price': 0, 'max_price': 1000, 'percentage': 10}])
+        self.assertFalse(MarkupRule.objects.exists())
+        self.assertEqual(sorted(Wine.objects.values_list('markup', flat=True)), [Decimal('50.00')] * 2)
+
+    def test_faixas_invalidas(self):
+        sobrepostas = [{'min_price': 0, 'max_price': 100, 'percentage': 10},
+                       {'min_price': 50, 'max_price': 200, 'percentage': 20}]
+        self.assertEqual(self.simular(sobrepostas).status_code, 400)
+        self.assertEqual(self.simular([{'min_price': 0, 'max_price': 100, 'percentage': 10}], bins=0).status_code, 400)
+
+    def test_sem_vinhos(self):
+        Wine.objects.all().delete()
+        response = self.simular([])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['proposto']['margem_percentual'], None)
+        self.assertEqual(response.data['histograma_precos']['limites'], [])
+
+
+class MarkupRuleTests(BaseTestCase):
+    def regra(self, min_price, max_price, percentage=50):
+        return self.escrever('post', REGRAS, {'min_price': min_price, 'max_price': max_price,
+                                              'percentage': percentage})
+
+    def test_faixas_que_se_tocam(self):
+        self.assertEqual(self.regra(0, 100).status_code, 201)
+        self.assertEqual(self.regra(100, 200).status_code, 201)
+
+    def test_sobreposicao_recusada(self):
+        self.regra(0, 100)
+        response = self.regra(50, 150)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(MarkupRule.objects.filter(user=self.user).count(), 1)
+
+    def test_faixa_vazia_recusada(self):
+        self.assertEqual(self.regra(100, 100).status_code, 400)
+        self.assertEqual(self.regra(100, 50).status_code, 400)
+
+    def test_substituicao_com_sobreposicao(self):
+        self.regra(0, 100)
+        response = self.escrever('put', REGRAS + 'replace/', {'rules': [
+            {'min_price': 0, 'max_price': 100, 'percentage': 40},
+            {'min_price': 90, 'max_price': 200, 'percentage': 30},
+        ]})
+        self.assertEqual(response.status_code, 400)
+        # Nada foi trocado
+        self.assertEqual(list(MarkupRule.objects.filter(user=self.user).values_list('percentage', flat=True)),
+                         [Decimal('50.00')])
+
+    def test_regra_reprecifica_vinhos(self):
+        vinho = self.criar_vinho(valor_custo=Decimal('50.00'))
+        self.regra(0, 100, 100)
+        vinho.refresh_from_db()
+        self.assertEqual(vinho.preco_venda, Decimal('100.00'))
+
+
+class MigracaoFaixasTests(SimpleTestCase):
+    sobreposicoes = staticmethod(importlib.import_module('wines.migrations.0004_markup_rule_exclusion').sobreposicoes)
+
+    def test_faixas_que_se_tocam_ou_de_outro_usuario(self):
+        regras = [(1, 'a', 0, 100), (2, 'a', 100, 200), (3, 'b', 50, 150)]
+        self.assertEqual(self.sobreposicoes(regras), [])
+
+    def test_sobreposicao_com_faixa_nao_adjacente(self):
+        # A regra 3 só cruza a 1, que começa antes da 2
+        regras = [(1, 'a', 0, 500), (2, 'a', 10, 20), (3, 'a', 300, 400)]
+        self.assertEqual(self.sobreposicoes(regras), [((1, 'a', 0, 500), (2, 'a', 10, 20)),
+                                                      ((1, 'a', 0, 500), (3, 'a', 300, 400))])
+
+    def test_faixa_vazia_nao_sobrepoe(self):
+        self.assertEqual(self.sobreposicoes([(1, 'a', 0, 100), (2, 'a', 50, 50)]), [])
+
+
+class EstoqueTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.vinho = self.criar_vinho(estoque=5)
+
+    def movimentar(self, tipo, quantidade):
+        return self.escrever('post', MOVIMENTOS, {'vinho': self.vinho.pk, 'tipo': tipo, 'quantidade': quantidade})
+
+    def test_entrada_e_saida(self):
+        self.assertEqual(self.movimentar('entrada', 3).status_code, 201)
+        self.assertEqual(self.movimentar('saida', 8).status_code, 201)
+        self.vinho.refresh_from_db()
+        self.assertEqual(self.vinho.estoque, 0)
+
+    def test_saida_sem_estoque_desfaz_o_movimento(self):
+        response = self.movimentar('saida', 6)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quantidade', response.data)
+        self.vinho.refresh_from_db()
+        self.assertEqual(self.vinho.estoque, 5)
+        self.assertFalse(MovimentoEstoque.objects.filter(user=self.user).exists())
+
+    def test_estoque_so_muda_por_movimento_depois_de_criado(self):
+        response = self.escrever('patch', f'{VINHOS}{self.vinho.pk}/', {'estoque': 99})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['estoque'], 5)
+        response = self.escrever('post', VINHOS + 'bulk/', [{'id': str(self.vinho.pk), 'estoque': 99}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('estoque', response.data['erros'][0])
+
+    def test_save_nao_desfaz_movimento_concorrente(self):
+        # Instância lida antes de um movimento de outra requisição
+        vinho = Wine.objects.get(pk=self.vinho.pk)
+        Wine.objects.filter(pk=vinho.pk).update(estoque=F('estoque') + 3)
+        vinho.nome = 'Gran Reserva'
+        vinho.save()
+        vinho.refresh_from_db()
+        self.assertEqual((vinho.nome, vinho.estoque), ('Gran Reserva', 8))
+
+    def test_upsert_nao_sobrescreve_estoque(self):
+        linha = linha_planilha(Nome='Importado')
+        importar(self.user, linha)
+        Wine.objects.filter(user=self.user, nome='Importado').update(estoque=3)
+        self.assertEqual(importar(self.user, {**linha, 'Estoque': '50'}, upsert=True).ignorados, 1)
+        importar(self.user, {**linha, 'Estoque': '50', 'Uva': 'Syrah'}, upsert=True)
+        vinho = Wine.objects.get(user=self.user, nome='Importado')
+        self.assertEqual((vinho.uva, vinho.estoque), ('Syrah', 3))
+
+
+class MovimentoLoteTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.vinho = self.criar_vinho(estoque=5)
+
+    def lote(self, itens):
+        return self.escrever('post', MOVIMENTOS + 'batch/', itens)
+
+    def test_lote_recusa_so_os_itens_sem_estoque(self):
+        outro = self.criar_vinho('Gran Reserva', estoque=0)
+        itens = [
+            {'vinho': str(self.vinho.pk), 'tipo': 'saida', 'quantidade': 4},
+            # Sobra 1: esta saída é recusada, a entrada seguinte não
+            {'vinho': str(self.vinho.pk), 'tipo': 'saida', 'quantidade': 2},
+            {'vinho': str(self.vinho.pk), 'tipo': 'entrada', 'quantidade': 10},
+            {'vinho': str(outro.pk), 'tipo': 'saida', 'quantidade': 1},
+            {'vinho': str(self.vinho.pk), 'tipo': 'saida', 'quantidade': -1},
+        ]
+        response = self.lote(itens)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.data['resultados']], ['ok', 'erro', 'ok', 'erro', 'erro'])
+        self.assertEqual((response.data['aceitos'], response.data['recusados']), (2, 3))
+        self.vinho.refresh_from_db()
+        outro.refresh_from_db()
+        self.assertEqual((self.vinho.estoque, outro.estoque), (11, 0))
+        self.assertEqual(MovimentoEstoque.objects.filter(user=self.user).count(), 2)
+
+    def test_lote_nao_aceita_vinho_de_outro_usuario(self):
+        alheio = CustomUser.objects.create_user(username='outro', password='x')
+        vinho = self.criar_vinho(user=alheio, estoque=5)
+        response = self.lote([{'vinho': str(vinho.pk), 'tipo': 'saida', 'quantidade': 1}])
+        self.assertEqual(response.data['recusados'], 1)
+        vinho.refresh_from_db()
+        self.assertEqual(vinho.estoque, 5)
+
+    def test_formato_e_tamanho_do_lote(self):
+        self.assertEqual(self.lote({'vinho': str(self.vinho.pk)}).status_code, 400)
+        item = {'vinho': str(self.vinho.pk), 'tipo': 'entrada', 'quantidade': 1}
+        self.assertEqual(self.lote([item] * (MAX_MOVIMENTOS_LOTE + 1)).status_code, 400)
+
+    def test_consultas_nao_crescem_com_o_lote(self):
+        vinhos = [self.vinho] + [self.criar_vinho(f'Vinho {i}', estoque=5) for i in range(3)]
+
+        def contar(quantidade):
+            itens = [{'vinho': str(vinhos[i % len(vinhos)].pk), 'tipo': 'saida', 'quantidade': 1}
+                     for i in range(quantidade)]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.lote(itens).data['aceitos'], quantidade)
+            return len(queries.captured_queries)
+
+        self.assertEqual(contar(2), contar(8))
+
+
+class HistoricoEstoqueTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hoje = timezone.localdate()
+        self.vinho = self.criar_vinho()
+        Wine.objects.filter(pk=self.vinho.pk).update(created_at=timezone.now() - timedelta(days=5))
+        # Entrada de 10 há 3 dias e saída de 4 ontem: estoque atual 6
+        self.movimentar('entrada', 10, dias_atras=3)
+        self.movimentar('saida', 4, dias_atras=1)
+        self.url = f'{VINHOS}{self.vinho.pk}/estoque_historico/'
+
+    def movimentar(self, tipo, quantidade, dias_atras):
+        movimento = self.escrever('post', MOVIMENTOS, {'vinho': self.vinho.pk, 'tipo': tipo,
+                                                       'quantidade': quantidade}).data
+        # Meio-dia do dia escolhido, longe da virada do dia
+        dia = datetime.combine(self.hoje - timedelta(days=dias_atras), time(12))
+        MovimentoEstoque.objects.filter(pk=movimento['id']).update(data_movimento=timezone.make_aware(dia))
+
+    def serie(self, dias):
+        inicio = self.hoje - timedelta(days=dias)
+        response = self.client.get(self.url, {'inicio': inicio.isoformat(), 'fim': self.hoje.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        return [dia['estoque'] for dia in response.data]
+
+    def test_serie_sem_fechamentos(self):
+        self.assertEqual(self.serie(4), [0, 10, 10, 6, 6])
+
+    def test_serie_com_fechamentos(self):
+        for dias_atras in (3, 1):
+            self.assertEqual(consolidar_dia(self.hoje - timedelta(days=dias_atras)), 1)
+        fechamento = EstoqueDiario.objects.get(data=self.hoje - timedelta(days=3))
+        self.assertEqual((fechamento.estoque, fechamento.entradas, fechamento.saidas), (10, 10, 0))
+        # Um movimento de hoje ainda não consolidado entra na série
+        self.movimentar('entrada', 1, dias_atras=0)
+        self.assertEqual(self.serie(2), [10, 6, 7])
+
+    def test_consolidar_de_novo_regrava_o_mesmo_dia(self):
+        ontem = self.hoje - timedelta(days=1)
+        consolidar_dia(ontem)
+        consolidar_dia(ontem)
+        self.assertEqual(list(EstoqueDiario.objects.values_list('estoque', flat=True)), [6])
+
+    def test_serie_comeca_na_criacao_do_vinho(self):
+        self.assertEqual(len(self.serie(30)), 6)
+
+    def test_intervalo_invalido(self):
+        self.assertEqual(self.client.get(self.url, {'inicio': '2024-13-01'}).status_code, 400)
+        inicio = self.hoje - timedelta(days=MAX_DIAS_HISTORICO)
+        self.assertEqual(self.client.get(self.url, {'inicio': inicio.isoformat()}).status_code, 400)
+
+
+class EstoqueBaixoTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.email, self.user.estoque_minimo_padrao = 'sommelier@example.com', 3
+        self.user.save()
+        self.importadora = Supplier.objects.create(user=self.user, nome='Importadora', email='pedidos@example.com')
+        # Abaixo do mínimo próprio, abaixo do padrão (sem fornecedor) e acima dos dois
+        self.criar_vinho('Reserva', estoque=4, estoque_minimo=5).fornecedores.set([self.importadora])
+        self.criar_vinho('Gran Reserva', estoque=3)
+        self.criar_vinho('Cuvée', estoque=10, estoque_minimo=5).fornecedores.set([self.importadora])
+
+    def test_vinhos_agrupados_por_fornecedor(self):
+        response = self.client.get(VINHOS + 'estoque_baixo/')
+        self.assertEqual(response.status_code, 200)
+        importadora, sem_fornecedor = response.data
+        self.assertEqual(importadora['fornecedor']['email'], 'pedidos@example.com')
+        self.assertEqual([(v['nome'], v['estoque_minimo']) for v in importadora['vinhos']], [('Reserva', 5)])
+        self.assertIsNone(sem_fornecedor['fornecedor'])
+        self.assertEqual([(v['nome'], v['estoque_minimo']) for v in sem_fornecedor['vinhos']], [('Gran Reserva', 3)])
+
+    def test_sem_minimo_padrao_so_entram_os_minimos_proprios(self):
+        self.user.estoque_minimo_padrao = None
+        self.user.save()
+        response = self.client.get(VINHOS + 'estoque_baixo/')
+        self.assertEqual([vinho['nome'] for grupo in response.data for vinho in grupo['vinhos']], ['Reserva'])
+
+    def test_email_de_alerta(self):
+        # Outro usuário sem vinhos abaixo do mínimo não recebe nada
+        CustomUser.objects.create_user(username='outro', password='x', email='outro@example.com',
+                                       estoque_minimo_padrao=1)
+        alertar_estoque_baixo()
+        self.assertEqual([mensagem.to for mensagem in mail.outbox], [['sommelier@example.com']])
+        self.assertIn('Gran Reserva', mail.outbox[0].body)
+        self.assertIn('Importadora', mail.outbox[0].body)
+
+
+class PaginacaoTests(BaseTestCase):
+    def percorrer(self, url):
+        ids, paginas = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            url, paginas = response.data['next'], paginas + 1
+        return ids, paginas
+
+    def test_cursor_percorre_tudo_sem_repetir(self):
+        vinhos = [self.criar_vinho(f'Vinho {i}') for i in range(7)]
+        # Empate em created_at: o id desempata e nenhuma linha se perde entre as páginas
+        Wine.objects.filter(pk__in=[vinho.pk for vinho in vinhos[2:5]]).update(created_at=vinhos[2].created_at)
+        esperado = [str(pk) for pk in Wine.objects.filter(user=self.user).order_by('-created_at', '-id')
+                    .values_list('pk', flat=True)]
+
+        ids, paginas = self.percorrer(VINHOS + '?page_size=3')
+        self.assertEqual(ids, esperado)
+        self.assertEqual(paginas, 3)
+
+    def test_pagina_anterior(self):
+        for i in range(5):
+            self.criar_vinho(f'Vinho {i}')
+        primeira = self.client.get(VINHOS + '?page_size=2').data
+        segunda = self.client.get(primeira['next']).data
+        self.assertEqual(self.client.get(segunda['previous']).data['results'], primeira['results'])
+
+    def test_busca_paginada_no_mesmo_formato(self):
+        for i in range(5):
+            self.criar_vinho(f'Vinho {i}', pais='Uruguai' if i % 2 else 'Chile')
+        # Termo com MIN_TERMO_APROXIMADO letras ou mais: documento "busca" e trigramas (pg_trgm)
+        esperado = [str(pk) for pk in Wine.objects.filter(user=self.user, pais='Chile').values_list('pk', flat=True)]
+        response = self.client.get(VINHOS + '?q=chile&page_size=2')
+        self.assertEqual(set(response.data), {'next', 'previous', 'results'})
+
+        ids, paginas = self.percorrer(VINHOS + '?q=chile&page_size=2')
+        self.assertCountEqual(ids, esperado)
+        self.assertEqual(paginas, 2)
+
+    def test_busca_curta_percorre_empates_de_relevancia(self):
+        for i in range(5):
+            self.criar_vinho(f'Vinho {i}', vinicula='Do Sul' if i % 2 else 'Vinícola')
+        # Termo curto: só o documento "busca", sem trigramas; relevâncias iguais são desempatadas por created_at e id
+        esperado = [str(pk) for pk in Wine.objects.filter(user=self.user, vinicula='Do Sul')
+                    .order_by('-created_at', '-id').values_list('pk', flat=True)]
+        ids, paginas = self.percorrer(VINHOS + '?q=do&page_size=1')
+        self.assertEqual(ids, esperado)
+        self.assertEqual(paginas, 2)
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.client.get(VINHOS + '?cursor=lixo').status_code, 404)
+
+    def test_movimentos_do_mais_novo_para_o_mais_antigo(self):
+        vinho = self.criar_vinho()
+        for quantidade in range(1, 6):
+            self.escrever('post', MOVIMENTOS, {'vinho': vinho.pk, 'tipo': 'entrada', 'quantidade': quantidade})
+        # Movimentos de outro usuário não aparecem
+        alheio = CustomUser.objects.create_user(username='outro', password='x')
+        MovimentoEstoque.objects.create(vinho=self.criar_vinho(user=alheio), user=alheio, tipo='entrada',
+                                        quantidade=1)
+
+        ids, paginas = self.percorrer(MOVIMENTOS + '?page_size=2')
+        esperado = list(MovimentoEstoque.objects.filter(user=self.user).order_by('-data_movimento', '-id')
+                        .values_list('pk', flat=True))
+        self.assertEqual(ids, esperado)
+        self.assertEqual(paginas, 3)
+
+    def test_pagina_seguinte_sem_offset(self):
+        for i in range(6):
+            self.criar_vinho(f'Vinho {i}')
+        segunda = self.client.get(VINHOS + '?page_size=2').data['next']
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.client.get(segunda).data['results']), 2)
+        self.assertFalse([query for query in queries.captured_queries if 'OFFSET' in query['sql']])
+
+
+class BulkTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.importadora = Supplier.objects.create(user=self.user, nome='Importadora')
+        self.vinho = self.criar_vinho(estoque=5)
+
+    def novo(self, nome, **campos):
+        return {'nome': nome, 'vinicula': 'Vinícola', 'pais': 'Chile', 'uva': 'Carmenere', 'safra': '2021',
+                'tamanho': Wine.INTEIRA, 'valor_custo': '30.00', **campos}
+
+    def lote(self, itens):
+        return self.escrever('post', VINHOS + 'bulk/', itens)
+
+    def test_cria_e_atualiza_numa_requisicao(self):
+        MarkupRule.objects.create(user=self.user, min_price=0, max_price=100, percentage=100)
+        response = self.lote([
+            self.novo('Novo', fornecedores=[str(self.importadora.pk)], estoque=7),
+            {'id': str(self.vinho.pk), 'valor_custo': '60.00', 'fornecedores': [str(self.importadora.pk)]},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['criados'], response.data['atualizados']), (1, 1))
+        self.assertEqual([vinho['nome'] for vinho in response.data['vinhos']], ['Novo', 'Reserva'])
+
+        novo = Wine.objects.get(nome='Novo')
+        self.assertEqual((novo.estoque, novo.preco_venda), (7, Decimal('60.00')))
+        self.vinho.refresh_from_db()
+        self.assertEqual((self.vinho.estoque, self.vinho.preco_venda), (5, Decimal('120.00')))
+        self.assertEqual(list(self.vinho.fornecedores.all()), [self.importadora])
+
+    def test_erro_em_um_item_nao_grava_nada(self):
+        alheio = CustomUser.objects.create_user(username='outro', password='x')
+        fornecedor_alheio = Supplier.objects.create(user=alheio, nome='Alheio')
+        vinho_alheio = self.criar_vinho(user=alheio)
+        response = self.lote([
+            self.novo('Novo'),
+            {'id': str(vinho_alheio.pk), 'nome': 'Invadido'},
+            self.novo('Outro', fornecedores=[str(fornecedor_alheio.pk)]),
+            {'id': str(self.vinho.pk), 'nome': 'Primeiro'},
+            {'id': str(self.vinho.pk), 'nome': 'Segundo'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([bool(erro) for erro in response.data['erros']], [False, True, True, False, True])
+        self.assertFalse(Wine.objects.filter(nome__in=['Novo', 'Outro', 'Invadido', 'Segundo']).exists())
+
+    def test_formato_e_tamanho_do_lote(self):
+        self.assertEqual(self.lote(self.novo('Novo')).status_code, 400)
+        self.assertEqual(self.lote([self.novo('Novo')] * (MAX_VINHOS_LOTE + 1)).status_code, 400)
+        response = self.lote([self.novo('Novo', safra='21')])
+        self.assertIn('safra', response.data['erros'][0])
+
+    def test_consultas_nao_crescem_com_o_lote(self):
+        def contar(quantidade):
+            itens = [self.novo(f'Vinho {quantidade}-{i}', fornecedores=[str(self.importadora.pk)])
+                     for i in range(quantidade)]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.lote(itens).status_code, 200)
+            return len(queries.captured_queries)
+
+        self.assertEqual(contar(2), contar(20))
+
+
+class FacetasTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # Sem regras de markup o preço de venda é o custo: Carmenere chileno a 40,00, o resto a 80,00
+        self.criar_vinho('Reserva', valor_custo=Decimal('40.00'))
+        self.criar_vinho('Gran Reserva', valor_custo=Decimal('40.00'))
+        self.criar_vinho('Malbec', uva='Malbec', valor_custo=Decimal('80.00'))
+        self.criar_vinho('Argentino', pais='Argentina', uva='Malbec', valor_custo=Decimal('80.00'))
+
+    def facetas(self, **filtros):
+        response = self.client.get(VINHOS + 'facetas/', filtros)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def contagens(self, faceta):
+        return {item['valor']: item['total'] for item in faceta}
+
+    def test_contagens_por_grouping_sets(self):
+        contagens = _contagens(Wine.objects.filter(user=self.user))
+        self.assertEqual(contagens['pais'], {'Chile': 3, 'Argentina': 1})
+        self.assertEqual(contagens['uva'], {'Carmenere': 2, 'Malbec': 2})
+        self.assertEqual(contagens['faixa_preco'], {0: 2, 1: 2})
+
+    def test_faceta_ignora_o_proprio_filtro(self):
+        facetas = self.facetas(pais='Chile')
+        self.assertEqual(self.contagens(facetas['pais']), {'Chile': 3, 'Argentina': 1})
+        self.assertEqual(self.contagens(facetas['uva']), {'Carmenere': 2, 'Malbec': 1})
+
+        facetas = self.facetas(pais='Chile', uva='Malbec')
+        self.assertEqual(self.contagens(facetas['pais']), {'Chile': 1, 'Argentina': 1})
+        self.assertEqual(self.contagens(facetas['uva']), {'Carmenere': 2, 'Malbec': 1})
+        self.assertEqual(self.contagens(facetas['safra']), {'2020': 1})
+
+    def test_faixa_de_preco_ignora_preco_min_e_max(self):
+        facetas = self.facetas(preco_min='50', preco_max='100')
+        self.assertEqual([faixa['total'] for faixa in facetas['faixas_preco']], [2, 2, 0, 0, 0])
+        self.assertEqual(self.contagens(facetas['uva']), {'Malbec': 2})
+
+    def test_uma_consulta_e_cache_ate_a_proxima_escrita(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.facetas(pais='Chile', uva='Malbec', preco_min='10')
+        self.assertEqual(len(queries.captured_queries), 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.facetas(pais='Chile', uva='Malbec', preco_min='10')
+        self.assertEqual(len(queries.captured_queries), 0)
+
+        self.escrever('post', VINHOS + 'bulk/', [{'nome': 'Novo', 'vinicula': 'Vinícola', 'pais': 'Uruguai',
+                                                   'uva': 'Tannat', 'safra': '2021', 'tamanho': Wine.INTEIRA,
+                                                   'valor_custo': '30.00'}])
+        self.assertEqual(self.contagens(self.facetas(pais='Chile')['pais'])['Uruguai'], 1)
+
+
+class ResumoTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        importadora = Supplier.objects.create(user=self.user, nome='Importadora')
+        distribuidora = Supplier.objects.create(user=self.user, nome='Distribuidora')
+        sem_estoque = Supplier.objects.create(user=self.user, nome='Sem estoque')
+        self.reserva = self.criar_vinho('Reserva', valor_custo=Decimal('50.00'), markup=Decimal('100.00'), estoque=4)
+        self.reserva.fornecedores.set([importadora, distribuidora])
+        self.criar_vinho('Gran Reserva', valor_custo=Decimal('20.00'), markup=Decimal('50.00'),
+                         estoque=10).fornecedores.set([importadora])
+        self.criar_vinho('Esgotado', valor_custo=Decimal('10.00'), estoque=0).fornecedores.set([sem_estoque])
+        # Inventário de outro usuário fica de fora
+        alheio = CustomUser.objects.create_user(username='outro', password='x')
+        self.criar_vinho(user=alheio, estoque=100)
+
+    def test_totais_e_fornecedores(self):
+        resumo = self.client.get(VINHOS + 'resumo/').data
+        self.assertEqual((resumo['total_vinhos'], resumo['total_garrafas']), (3, 14))
+        self.assertEqual((resumo['valor_custo'], resumo['valor_venda']), (Decimal('400.00'), Decimal('700.00')))
+        self.assertEqual(resumo['markup_medio'], Decimal('50.00'))
+        # Só fornecedores com garrafas em estoque, do maior valor a custo para o menor
+        self.assertEqual([(f['nome'], f['garrafas'], f['valor_custo']) for f in resumo['top_fornecedores']],
+                         [('Importadora', 14, Decimal('400.00')), ('Distribuidora', 4, Decimal('200.00'))])
+
+    def test_inventario_vazio(self):
+        Wine.objects.filter(user=self.user).delete()
+        resumo = self.client.get(VINHOS + 'resumo/').data
+        self.assertEqual((resumo['total_garrafas'], resumo['valor_custo'], resumo['markup_medio']), (0, 0, None))
+        self.assertEqual(resumo['top_fornecedores'], [])
+
+    def test_cache_ate_a_proxima_escrita(self):
+        self.client.get(VINHOS + 'resumo/')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(VINHOS + 'resumo/')
+        self.assertEqual(len(queries.captured_queries), 0)
+
+        self.escrever('post', MOVIMENTOS, {'vinho': self.reserva.pk, 'tipo': 'entrada', 'quantidade': 6})
+        self.assertEqual(self.client.get(VINHOS + 'resumo/').data['total_garrafas'], 20)
+
+
+class GetCondicionalTests(BaseTestCase):
+    # Query strings diferentes caem em entradas diferentes do cache de respostas: o 304 vem do ETag calculado
+    def setUp(self):
+        super().setUp()
+        self.vinho = self.criar_vinho()
+        self.detalhe = f'{VINHOS}{self.vinho.pk}/'
+
+    def test_listagem_devolve_304_sem_consultar_os_vinhos(self):
+        etag = self.client.get(VINHOS)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(VINHOS + '?page_size=10', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        # Só o agregado do ETag
+        self.assertEqual(len(queries.captured_queries), 1)
+
+    def test_last_modified_so_no_detalhe(self):
+        self.assertFalse(self.client.get(VINHOS).has_header('Last-Modified'))
+        last_modified = self.client.get(self.detalhe)['Last-Modified']
+        response = self.client.get(self.detalhe + '?format=json', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_escrita_muda_o_etag(self):
+        etag = self.client.get(self.detalhe)['ETag']
+        self.escrever('patch', self.detalhe, {'uva': 'Syrah'})
+        response = self.client.get(self.detalhe + '?format=json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['uva'], 'Syrah')
+
+    def test_alteracao_so_nos_fornecedores_muda_o_etag(self):
+        etag = self.client.get(self.detalhe)['ETag']
+        importadora = Supplier.objects.create(user=self.user, nome='Importadora')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vinho.fornecedores.add(importadora)
+        response = self.client.get(self.detalhe + '?format=json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['fornecedores'], [importadora.pk])
+
+    def test_pk_invalido(self):
+        self.assertEqual(self.client.get(VINHOS + 'nao-e-uuid/').status_code, 404)
+
+
+class CacheRespostasTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.vinho = self.criar_vinho()
+
+    def test_acerto_sem_consultas(self):
+        primeira = self.client.get(VINHOS)
+        self.assertEqual(primeira['X-Cache'], 'MISS')
+        with CaptureQueriesContext(connection) as queries:
+            segunda = self.client.get(VINHOS)
+        self.assertEqual(len(queries.captured_queries), 0)
+        self.assertEqual(segunda['X-Cache'], 'HIT')
+        self.assertEqual((segunda['ETag'], segunda.data), (primeira['ETag'], primeira.data))
+        self.assertEqual(self.client.get(VINHOS, HTTP_IF_NONE_MATCH=primeira['ETag']).status_code, 304)
+
+    def test_escrita_invalida_cache_e_etag(self):
+        antes = self.client.get(VINHOS)
+        self.escrever('post', MOVIMENTOS, {'vinho': self.vinho.pk, 'tipo': 'entrada', 'quantidade': 4})
+
+        depois = self.client.get(VINHOS, HTTP_IF_NONE_MATCH=antes['ETag'])
+        self.assertEqual(depois.status_code, 200)
+        self.assertEqual(depois['X-Cache'], 'MISS')
+        self.assertNotEqual(depois['ETag'], antes['ETag'])
+        self.assertEqual(depois.data['results'][0]['estoque'], 4)
+
+    def test_regra_de_markup_invalida_cache(self):
+        self.client.get(VINHOS)
+        self.escrever('post', REGRAS, {'min_price': 0, 'max_price': 100, 'percentage': 100})
+        response = self.client.get(VINHOS)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['preco_venda'], '100.00')
+
+    def test_cache_separado_por_usuario(self):
+        self.client.get(VINHOS)
+        outro = CustomUser.objects.create_user(username='outro', password='x')
+        self.client.force_authenticate(outro)
+        response = self.client.get(VINHOS)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'], [])
+
+    def test_estatisticas_so_para_admin(self):
+        self.assertEqual(self.client.get('/api/v1/wines/cache_stats/').status_code, 403)
+        self.client.get(VINHOS)
+        self.client.get(VINHOS)
+        self.client.force_authenticate(CustomUser.objects.create_superuser(username='admin', password='x'))
+        self.assertEqual(self.client.get('/api/v1/wines/cache_stats/').data,
+                         {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from wines.api.viewsets import WineViewSet, MovimentoEstoqueViewSet, ExportExcelView, ImportExcelView, MarkupRuleViewSet
+from wines.api.viewsets import WineViewSet, MovimentoEstoqueViewSet, ExportExcelView, ImportExcelView, MarkupRuleViewSet, \
+    ImportJobViewSet, ResponseCacheStatsView
 
 app_name = 'wines'
 
@@ -8,9 +9,11 @@ router = DefaultRouter()
 router.register(r'wines', WineViewSet)
 router.register(r'movimentos', MovimentoEstoqueViewSet)
 router.register(r'markup_rules', MarkupRuleViewSet)
+router.register(r'import_jobs', ImportJobViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
     path('export/', ExportExcelView.as_view(), name='export-excel'),
     path('import/', ImportExcelView.as_view(), name='import-excel'),
+    path('cache_stats/', ResponseCacheStatsView.as_view(), name='cache-stats'),
 ]
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+from wines.models import Wine
+from wines.readers import read_frame
+
+COLUNAS = ['Nome', 'Vinícola', 'País', 'Uva', 'Safra', 'Tamanho', 'Fornecedores', 'Valor de Custo', 'Markup', 'Estoque']
+
+# Tamanho aceito tanto pelo valor ('meia') quanto pelo rótulo exportado ('Meia Garrafa')
+TAMANHOS = {
+    **{valor: valor for valor, _ in Wine.TAMANHO_CHOICES},
+    **{titulo.lower(): valor for valor, titulo in Wine.TAMANHO_CHOICES},
+}
+
+# Tamanho máximo de cada coluna de texto (o mesmo dos campos do modelo)
+MAX_LENGTHS = {'Nome': 255, 'Vinícola': 255, 'País': 100, 'Uva': 100}
+# Tamanho máximo de cada nome da lista de fornecedores (Supplier.nome)
+MAX_LENGTH_FORNECEDOR = 255
+
+# O Excel entrega o ano como número (2019.0); o mesmo texto pode vir de um csv exportado dele
+SUFIXO_SAFRA = r'\.0+$'
+
+# Linhas com erro listadas no relatório do dry-run e no job de importação (as contagens continuam completas)
+MAX_ERROS_RELATORIO = 1000
+
+
+def _texto(df):
+    # Cada coluna convertida uma vez para texto; vazios (None, NaN ou só espaços) viram NA
+    return df.astype('string').apply(lambda coluna: coluna.str.strip()).replace('', pd.NA)
+
+
+def _numero(texto):
+    # (valor numérico, máscara de células preenchidas com algo que não é número)
+    numeros = pd.to_numeric(texto, errors='coerce').astype('float64')
+    return numeros, numeros.isna() & texto.notna()
+
+
+def _checks(df):
+    # [(coluna, máscara das linhas inválidas, mensagem)], com as mesmas regras do modelo Wine
+    df = _texto(df.reindex(columns=COLUNAS))
+    checks = []
+    checks.append(('Nome', df['Nome'].isna().to_numpy(), "Nome é obrigatório."))
+    for coluna, limite in MAX_LENGTHS.items():
+        tamanho = df[coluna].str.len().fillna(0).to_numpy()
+        checks.append((coluna, tamanho > limite, f"Deve ter no máximo {limite} caracteres."))
+
+    # Um nome grande demais em qualquer posição da lista invalida a linha
+    nomes = df['Fornecedores'].str.split(',').explode().str.strip()
+    maior = nomes.str.len().groupby(level=0).max().reindex(df.index).fillna(0).to_numpy(dtype=int)
+    checks.append(('Fornecedores', maior > MAX_LENGTH_FORNECEDOR,
+                   f"Cada fornecedor deve ter no máximo {MAX_LENGTH_FORNECEDOR} caracteres."))
+
+    safra = df['Safra'].str.replace(SUFIXO_SAFRA, '', regex=True)
+    checks.append(('Safra', ~safra.str.fullmatch(r'\d{4}').fillna(False).to_numpy(dtype=bool),
+                   "Ano da safra deve conter 4 dígitos."))
+
+    tamanho = df['Tamanho'].str.lower()
+    checks.append(('Tamanho', (tamanho.notna() & ~tamanho.isin(list(TAMANHOS))).to_numpy(dtype=bool),
+                   f"Tamanho deve ser um de: {', '.join(TAMANHOS)}."))
+
+    custo, custo_invalido = _numero(df['Valor de Custo'])
+    checks.append(('Valor de Custo', custo_invalido.to_numpy(), "Valor de custo não é um número."))
+    checks.append(('Valor de Custo', (~custo_invalido & ~(custo >= 0.01)).to_numpy(),
+                   "Valor de custo deve ser no mínimo 0.01."))
+    checks.append(('Valor de Custo', (custo >= 10 ** 8).to_numpy(), "Valor de custo muito alto."))
+
+    markup, markup_invalido = _numero(df['Markup'])
+    checks.append(('Markup', (markup_invalido | (markup.abs() >= 1000)).to_numpy(),
+                   "Markup deve ser um número menor que 1000."))
+
+    estoque, estoque_invalido = _numero(df['Estoque'])
+    estoque_invalido |= (estoque < 0) | (estoque.notna() & (estoque % 1 != 0))
+    checks.append(('Estoque', estoque_invalido.to_numpy(),
+                   "Estoque deve ser um número inteiro maior ou igual a zero."))
+    return checks
+
+
+def _erros(linhas, checks, indices=None):
+    # {linha: {coluna: erro}} das linhas inválidas (só das posições em ``indices``, se dadas)
+    erros = {}
+    for coluna, mascara, mensagem in checks:
+        posicoes = np.flatnonzero(mascara)
+        if indices is not None:
+            posicoes = np.intersect1d(posicoes, indices, assume_unique=True)
+        for linha in linhas[posicoes]:
+            erros.setdefault(int(linha), {}).setdefault(coluna, mensagem)
+    return erros
+
+
+def validate_rows(rows):
+    """
+    Valida um lote de pares ``(numero_da_linha, linha)`` coluna a coluna,
+    com as mesmas regras do modelo ``Wine``. Retorna ``{linha: {coluna: erro}}``
+    apenas para as linhas inválidas.
+    """
+    if not rows:
+        return {}
+    linhas = np.array([linha for linha, _ in rows])
+    df = pd.DataFrame.from_records([row for _, row in rows], columns=COLUNAS)
+    return _erros(linhas, _checks(df))
+
+
+def dry_run(arquivo):
+    """
+    Valida a planilha inteira sem gravar nada e devolve um relatório
+    compacto. O arquivo é lido direto num DataFrame e as contagens saem das
+    máscaras de cada regra; só as primeiras linhas com erro viram dicts.
+    """
+    linhas, df = read_frame(arquivo)
+    checks = _checks(df)
+
+    invalida = np.zeros(len(df), dtype=bool)
+    por_coluna = {}
+    for coluna in dict.fromkeys(coluna for coluna, _, _ in checks):
+        # Uma linha conta uma vez por coluna, mesmo que quebre mais de uma regra dela
+        mascara = np.logical_or.reduce([m for c, m, _ in checks if c == coluna])
+        invalida |= mascara
+        if mascara.any():
+            por_coluna[coluna] = int(mascara.sum())
+
+    primeiras = np.flatnonzero(invalida)[:MAX_ERROS_RELATORIO]
+    erros = _erros(linhas, checks, primeiras)
+    invalidas = int(invalida.sum())
+    return {
+        'total_linhas': len(df),
+        'linhas_validas': len(df) - invalidas,
+        'linhas_invalidas': invalidas,
+        'erros_por_coluna': por_coluna,
+        'erros': [{'linha': linha, 'erros': colunas} for linha, colunas in sorted(erros.items())],
+        'erros_truncados': invalidas > len(primeiras),
+    }